@@ -1,8 +1,29 @@
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
-from collections import defaultdict
+from collections import defaultdict, namedtuple, deque
 import traceback
+import heapq
+import argparse
+import shlex
+import tempfile
+import shutil
+import time
+import zipfile
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+import mmap
+import struct
+import threading
+import hashlib
+import math
+import io
+import gzip
+import bz2
+import lzma
+from array import array
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from bisect import bisect_left, bisect_right
 
 
 class InvalidNameError(Exception):
@@ -21,6 +42,38 @@ class ReferenceBookLimitError(Exception):
     #Raised when trying to borrow reference book for more than 14 days
     pass
 
+class BookUnavailableError(Exception):
+    #Raised when no copy of a book is available to rent
+    pass
+
+class ReadOnlyRecordsError(Exception):
+    #Raised when trying to modify records opened in read-only mode
+    pass
+
+
+#Money is held as integer cents; AUD amounts only appear when reading input and printing
+CENTS_PER_AUD = 100
+RATE_SCALE = 1000000  # rates are applied as whole millionths
+
+def to_cents(amount):
+    """Convert an AUD amount, e.g. 3.55 or '3.55', to integer cents, rounding half up
+
+    Raises ValueError for malformed amounts, like float() does.
+    """
+    try:
+        return int((Decimal(str(amount)) * CENTS_PER_AUD).quantize(Decimal(1), ROUND_HALF_UP))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {amount!r}") from None
+
+def format_cents(cents):
+    sign = '-' if cents < 0 else ''
+    return f"{sign}{abs(cents) // CENTS_PER_AUD}.{abs(cents) % CENTS_PER_AUD:02d}"
+
+def apply_rate(cents, rate, divisor=1):
+    """cents * rate / divisor, rounded half up, with the rate taken to millionths"""
+    scale = RATE_SCALE * divisor
+    return (cents * round(rate * RATE_SCALE) + scale // 2) // scale
+
 
 
 class Customer:
@@ -32,115 +85,398 @@ class Customer:
         self.name = name
         self.customer_type = 'C'
 
+    def describe(self):
+        return f"ID: {self.id}, Name: {self.name}"
+
     def display_info(self):
-        print(f"ID: {self.id}, Name: {self.name}")
+        print(self.describe())
+
+class RateHistory:
+    """Effective-dated history of a discount or reward rate
+
+    Changes are kept sorted by the time they take effect, so the rate that applied to a
+    rental is a binary search over the start times. The opening rate applies from the
+    beginning of time.
+    """
+    def __init__(self, opening_rate=None):
+        self.starts = array('d')  # POSIX time each rate takes effect, ascending
+        self.rates = array('d')
+        if opening_rate is not None:
+            self.set(opening_rate, float('-inf'))
+
+    def __len__(self):
+        return len(self.rates)
+
+    @staticmethod
+    def _as_posix(timestamp):
+        if timestamp is None:
+            return time.time()
+        if isinstance(timestamp, datetime):
+            return timestamp.timestamp()
+        return timestamp
+
+    def set(self, rate, effective=None):
+        """Make rate apply from effective (default now); a change at the same time replaces it"""
+        # Saved start times have whole seconds, so a change made now takes effect from the next
+        # whole second; rentals made earlier in the same second keep the old rate after a reload
+        effective = float(math.ceil(time.time())) if effective is None else self._as_posix(effective)
+        i = bisect_right(self.starts, effective)
+        if i and self.starts[i - 1] == effective:
+            self.rates[i - 1] = rate
+        else:
+            self.starts.insert(i, effective)
+            self.rates.insert(i, rate)
+
+    def lookup(self, timestamp=None):
+        """Return (start, rate) of the change in effect at timestamp (default now)"""
+        timestamp = self._as_posix(timestamp)
+        starts = self.starts
+        if starts and starts[-1] <= timestamp:
+            # Usually the latest rate, no search needed
+            return starts[-1], self.rates[-1]
+        i = bisect_right(starts, timestamp)
+        if not i:
+            return float('-inf'), None
+        return self.starts[i - 1], self.rates[i - 1]
+
+    def rate_at(self, timestamp=None):
+        return self.lookup(timestamp)[1]
+
+    @staticmethod
+    def effective(tier_history, own_history, timestamp=None):
+        """Rate from whichever of the tier-wide and customer's own history changed last"""
+        timestamp = RateHistory._as_posix(timestamp)
+        start, rate = tier_history.lookup(timestamp)
+        if own_history is not None:
+            own_start, own_rate = own_history.lookup(timestamp)
+            if own_rate is not None and own_start >= start:
+                return own_rate
+        return rate
+
+    def replay(self, entries):
+        """Rebuild the history from (start, rate) entries"""
+        entries = sorted(entries, key=lambda entry: entry[0])
+        self.starts = array('d', (entry[0] for entry in entries))
+        self.rates = array('d', (entry[1] for entry in entries))
+
+    def entries(self):
+        for start, rate in zip(self.starts, self.rates):
+            yield (None if start == float('-inf') else datetime.fromtimestamp(start)), rate
 
 class Member(Customer):
     #Customer with discount benefits
-    __discount_rate = 0.10  # default 10%
+    DEFAULT_DISCOUNT_RATE = 0.10
 
     def __init__(self, customer_id, name, discount_rate=None):
         super().__init__(customer_id, name)
         self.customer_type = 'M'
-        if discount_rate is not None:
-            self.__discount_rate = discount_rate
+        # Tier-wide rate history; Records replaces it with the one its members share
+        self.tier_discount_rates = RateHistory(self.DEFAULT_DISCOUNT_RATE)
+        # A rate of the customer's own overrides the tier until the tier rate next changes
+        self.own_discount_rates = RateHistory(discount_rate) if discount_rate is not None else None
 
     @property
     def discount_rate(self):
-        return self.__discount_rate
+        return self.discount_rate_at()
 
-    @staticmethod
-    def set_discount_rate(new_rate):
-        if not 0 < new_rate < 1:
-            raise ValueError("Discount rate must be between 0 and 1")
-        Member.discount_rate = new_rate
+    def discount_rate_at(self, timestamp=None):
+        return RateHistory.effective(self.tier_discount_rates, self.own_discount_rates, timestamp)
+
+    def get_discount(self, rental_cost, timestamp=None):
+        return apply_rate(rental_cost, self.discount_rate_at(timestamp))
 
-    def get_discount(self, rental_cost):
-        return rental_cost * self.discount_rate
+    def describe(self):
+        return f"ID: {self.id}, Name: {self.name}, Discount Rate: {self.discount_rate*100}%"
 
     def display_info(self):
-        print(f"ID: {self.id}, Name: {self.name}, Discount Rate: {self.discount_rate*100}%")
+        print(self.describe())
+
+class RewardLedger:
+    """Append-only earn/redeem history of a Gold member's reward points
+
+    Entries live in typed arrays and carry the running balance, so the current balance
+    is O(1) and the balance at any time is a binary search over the timestamps.
+    """
+    ADJUST = 0  # opening balance and direct corrections
+    EARN = 1
+    REDEEM = 2
+
+    def __init__(self, opening_balance=0):
+        self.timestamps = array('d')  # POSIX time of each entry, never decreasing
+        self.kinds = array('b')
+        self.points = array('q')  # signed change in points
+        self.balances = array('q')  # balance after each entry
+        self._balance = 0
+        if opening_balance:
+            self.append(self.ADJUST, opening_balance, 0.0)
+
+    @property
+    def balance(self):
+        return self._balance
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def append(self, kind, points, timestamp=None):
+        if timestamp is None:
+            timestamp = datetime.now().timestamp()
+        elif isinstance(timestamp, datetime):
+            timestamp = timestamp.timestamp()
+        # Entries are posted in order, so a late entry is stamped with the latest time
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            timestamp = self.timestamps[-1]
+        self._balance += points
+        self.timestamps.append(timestamp)
+        self.kinds.append(kind)
+        self.points.append(points)
+        self.balances.append(self._balance)
+
+    def earn(self, points, timestamp=None):
+        if points < 0:
+            raise ValueError("Earned points cannot be negative")
+        if points:
+            self.append(self.EARN, points, timestamp)
+
+    def redeem(self, points, timestamp=None):
+        if points < 0:
+            raise ValueError("Redeemed points cannot be negative")
+        if points > self._balance:
+            raise ValueError("Reward points balance cannot go negative")
+        if points:
+            self.append(self.REDEEM, -points, timestamp)
+
+    def balance_at(self, timestamp):
+        """Balance after every entry posted up to and including timestamp"""
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.timestamp()
+        i = bisect_right(self.timestamps, timestamp)
+        return self.balances[i - 1] if i else 0
+
+    def replay(self, entries):
+        """Rebuild the ledger in one pass from (timestamp, kind, points) entries"""
+        entries = sorted(entries, key=lambda entry: entry[0])
+        self.timestamps = array('d', (entry[0] for entry in entries))
+        self.kinds = array('b', (entry[1] for entry in entries))
+        self.points = array('q', (entry[2] for entry in entries))
+        self.balances = array('q')
+        balance = 0
+        for points in self.points:
+            balance += points
+            self.balances.append(balance)
+        self._balance = balance
+
+    def entries(self):
+        for i in range(len(self.kinds)):
+            yield datetime.fromtimestamp(self.timestamps[i]), self.kinds[i], self.points[i], self.balances[i]
 
 class GoldMember(Customer):
     #Member with discount and reward benefits
-    __gold_discount_rate = 0.12  #default 12%
+    DEFAULT_DISCOUNT_RATE = 0.12
 
     def __init__(self, customer_id, name, discount_rate=None, reward_rate=1.0, reward_points=0):
         super().__init__(customer_id, name)
         self.customer_type = 'G'
-        if discount_rate is not None:
-            self.__gold_discount_rate = discount_rate
-        self.__reward_rate = reward_rate
-        self.reward_points = reward_points
+        # Tier-wide rate history; Records replaces it with the one its members share
+        self.tier_discount_rates = RateHistory(self.DEFAULT_DISCOUNT_RATE)
+        self.own_discount_rates = RateHistory(discount_rate) if discount_rate is not None else None
+        self.reward_rates = RateHistory(reward_rate)
+        self.ledger = RewardLedger(reward_points)
 
     @property
     def discount_rate(self):
-        return self.__gold_discount_rate
+        return self.discount_rate_at()
+
+    def discount_rate_at(self, timestamp=None):
+        return RateHistory.effective(self.tier_discount_rates, self.own_discount_rates, timestamp)
 
     @property
     def reward_rate(self):
-        return self.__reward_rate
+        return self.reward_rates.rate_at()
 
-    @staticmethod
-    def set_discount_rate(new_rate):
-        if not 0 < new_rate < 1:
-            raise ValueError("Discount rate must be between 0 and 1")
-        GoldMember.gold_discount_rate = new_rate
+    def reward_rate_at(self, timestamp=None):
+        return self.reward_rates.rate_at(timestamp)
 
-    def get_discount(self, rental_cost):
-        return rental_cost * self.discount_rate
+    def get_discount(self, rental_cost, timestamp=None):
+        return apply_rate(rental_cost, self.discount_rate_at(timestamp))
 
     @reward_rate.setter
     def reward_rate(self, value):
-        if value <= 0:
-            raise ValueError("Reward rate must be positive")
-        self.__reward_rate = value
+        self.set_reward_rate(value)
+
+    def get_reward(self, amount, timestamp=None):
+        #Points are earned per AUD of the amount in cents
+        return apply_rate(amount, self.reward_rate_at(timestamp), CENTS_PER_AUD)
 
-    def get_reward(self, amount):
-        return round(amount * self.reward_rate)
+    @property
+    def reward_points(self):
+        return self.ledger.balance
 
-    def update_reward(self, value):
-        new_balance = self.reward_points + value
-        if new_balance < 0:
+    @reward_points.setter
+    def reward_points(self, value):
+        if value < 0:
             raise ValueError("Reward points balance cannot go negative")
-        self.reward_points = new_balance
+        self.ledger.append(RewardLedger.ADJUST, value - self.ledger.balance)
+
+    def update_reward(self, value, timestamp=None):
+        if value >= 0:
+            self.ledger.earn(value, timestamp)
+        else:
+            self.ledger.redeem(-value, timestamp)
 
-    def set_reward_rate(self, new_rate):
-        self.reward_rate = new_rate
+    def redeem_reward(self, points, timestamp=None):
+        self.ledger.redeem(points, timestamp)
+
+    def set_reward_rate(self, new_rate, effective=None):
+        if new_rate <= 0:
+            raise ValueError("Reward rate must be positive")
+        self.reward_rates.set(new_rate, effective)
+
+    def describe(self):
+        return (f"ID: {self.id}, Name: {self.name}, "
+                f"Discount Rate: {self.discount_rate*100:.1f}%, "
+                f"Reward Rate: {self.reward_rate*100:.1f}%, "
+                f"Reward Points: {self.reward_points}")
 
     def display_info(self):
         """Display complete member information"""
-        print(f"ID: {self.id}, Name: {self.name}, "
-              f"Discount Rate: {self.discount_rate*100:.1f}%, "
-              f"Reward Rate: {self.reward_rate*100:.1f}%, "
-              f"Reward Points: {self.reward_points}")
+        print(self.describe())
 
 class Book:
     """Class representing a book"""
-    def __init__(self, book_id, name, category=None):
+    def __init__(self, book_id, name, category=None, copies=1):
         self.id = book_id
         self.name = name
         self.category = category
+        self.copies = copies
 
     def get_price(self, days):
         if self.category:
             return self.category.get_price(days)
         return 0
 
-    def display_info(self):
+    def describe(self):
         category_name = self.category.name if self.category else "None"
-        print(f"ID: {self.id}, Name: {self.name}, Category: {category_name}")
+        return f"ID: {self.id}, Name: {self.name}, Category: {category_name}"
+
+    def display_info(self):
+        print(self.describe())
+
+class PriceSchedule:
+    """Tiered per-day prices compiled into a cumulative piecewise-linear table
+
+    tiers is a list of (daily price in AUD, last day of the tier), with None as the last
+    day of the final tier, e.g. [(0.5, 7), (0.4, None)] for the classic 7-day split.
+    Pricing is a binary search for the tier plus one integer multiply, optionally capped,
+    and returns cents. Daily prices are compiled to hundredths of a cent, so prices with
+    up to four decimals are exact.
+    """
+    UNITS_PER_CENT = 100
+
+    def __init__(self, tiers, cap=None):
+        if not tiers or tiers[-1][1] is not None:
+            raise ValueError("The last price tier must be open-ended")
+        if cap is not None and cap <= 0:
+            raise ValueError("Price cap must be positive")
+        self.tiers = [(float(price), last_day) for price, last_day in tiers]
+        self.cap = cap
+        self._cap_cents = to_cents(cap) if cap is not None else None
+        self._starts = [0]  # first day (exclusive) of each tier
+        self._rates = []  # daily price in hundredths of a cent
+        self._cumulative = [0]  # price of all days before each tier, in hundredths of a cent
+        for price, last_day in self.tiers:
+            if price < 0:
+                raise ValueError("Prices cannot be negative")
+            rate = to_cents(Decimal(str(price)) * self.UNITS_PER_CENT)
+            self._rates.append(rate)
+            if last_day is not None:
+                if last_day <= self._starts[-1]:
+                    raise ValueError("Tier boundaries must increase")
+                self._cumulative.append(self._cumulative[-1] + (last_day - self._starts[-1]) * rate)
+                self._starts.append(last_day)
+
+    @classmethod
+    def two_tier(cls, price_1, price_2, split=7, cap=None):
+        return cls([(price_1, split), (price_2, None)], cap)
+
+    @classmethod
+    def parse(cls, text, cap=None):
+        """Parse 'price:last_day/.../price', e.g. '0.5:7/0.4:14/0.3'"""
+        tiers = []
+        for part in text.split('/'):
+            price, _, last_day = part.partition(':')
+            tiers.append((float(price), int(last_day) if last_day else None))
+        return cls(tiers, cap)
+
+    def encode(self):
+        return '/'.join(f"{price}:{last_day}" if last_day is not None else f"{price}"
+                        for price, last_day in self.tiers)
+
+    def is_two_tier(self):
+        #True for the original format: two tiers split at day 7 and no cap
+        return len(self.tiers) == 2 and self.tiers[0][1] == 7 and self.cap is None
+
+    def price(self, days):
+        """Price of a rental of days in cents"""
+        i = bisect_right(self._starts, days) - 1
+        units = self._cumulative[i] + (days - self._starts[i]) * self._rates[i]
+        cost = (units + self.UNITS_PER_CENT // 2) // self.UNITS_PER_CENT
+        if self._cap_cents is not None and cost > self._cap_cents:
+            return self._cap_cents
+        return cost
+
+    def tier_days(self, days):
+        """Days of a rental that fall into each tier"""
+        result = []
+        for i, start in enumerate(self._starts):
+            end = self._starts[i + 1] if i + 1 < len(self._starts) else days
+            result.append(max(min(days, end) - start, 0))
+        return result
 
 class BookCategory:
     """Class representing a book category"""
-    def __init__(self, category_id, name, price_1, price_2, category_type="Rental"):
+    def __init__(self, category_id, name, price_1, price_2, category_type="Rental", tiers=None, cap=None,
+                 series_rate=0.5):
         self.id = category_id
         self.name = name
-        self.price_1 = price_1  # Price per day for first tier
-        self.price_2 = price_2  # Price per day for second tier
+        # Price per day for first tier, second tier (from day 8) and so on
+        self.schedule = PriceSchedule(tiers, cap) if tiers else PriceSchedule.two_tier(price_1, price_2, cap=cap)
+        if not 0 < series_rate <= 1:
+            raise ValueError("Series rate must be between 0 and 1")
+        self.series_rate = series_rate  # share of the books' total price charged for a series
         self.__type = category_type
         self.books = []
 
+    @property
+    def price_1(self):
+        return self.schedule.tiers[0][0]
+
+    @price_1.setter
+    def price_1(self, value):
+        tiers = list(self.schedule.tiers)
+        tiers[0] = (value, tiers[0][1])
+        self.schedule = PriceSchedule(tiers, self.schedule.cap)
+
+    @property
+    def price_2(self):
+        tiers = self.schedule.tiers
+        return tiers[1][0] if len(tiers) > 1 else tiers[0][0]
+
+    @price_2.setter
+    def price_2(self, value):
+        tiers = list(self.schedule.tiers)
+        if len(tiers) == 1:
+            tiers = [(tiers[0][0], 7), (value, None)]
+        else:
+            tiers[1] = (value, tiers[1][1])
+        self.schedule = PriceSchedule(tiers, self.schedule.cap)
+
+    @property
+    def cap(self):
+        return self.schedule.cap
+
+    def set_schedule(self, tiers, cap=None):
+        self.schedule = PriceSchedule(tiers, cap)
+
     @property
     def type(self):
         return self.__type
@@ -164,15 +500,22 @@ class BookCategory:
             book.category = None
 
     def get_price(self, days):
-        if days <= 7:
-            return days * self.price_1
-        else:
-            return 7 * self.price_1 + (days - 7) * self.price_2
+        return self.schedule.price(days)
 
-    def display_info(self):
+    def describe(self):
         book_names = [book.name for book in self.books]
-        print(f"ID: {self.id}, Name: {self.__name}, Type: {self.type}, "
-              f"Price 1: {self.price_1}, Price 2: {self.price_2}, Books: {', '.join(book_names)}")
+        extras = ""
+        if not self.schedule.is_two_tier():
+            extras += f", Tiers: {self.schedule.encode()}"
+            if self.cap is not None:
+                extras += f", Cap: {self.cap}"
+        if self.series_rate != 0.5:
+            extras += f", Series Rate: {self.series_rate}"
+        return (f"ID: {self.id}, Name: {self.name}, Type: {self.type}, "
+                f"Price 1: {self.price_1}, Price 2: {self.price_2}{extras}, Books: {', '.join(book_names)}")
+
+    def display_info(self):
+        print(self.describe())
 
 class BookSeries:
     def __init__(self, series_id, books):
@@ -180,55 +523,132 @@ class BookSeries:
         self.books = books
         #assume all books of a book series are existing books in the system and all books from a book series belong to the same book category.
 
+    @property
+    def series_rate(self):
+        #All books of a series share a category, which sets the series rate (50% by default)
+        for book in self.books:
+            if book and book.category:
+                return book.category.series_rate
+        return 0.5
+
     def get_price(self, days):
-        # Price is 50% of total individual book prices
         total = sum(book.get_price(days) for book in self.books)
-        return total * 0.5
+        return apply_rate(total, self.series_rate)
 
-    def display_info(self):
+    def describe(self):
         book_names = [book.name for book in self.books if book]
+        return f"ID: {self.id}, Books in Series: {', '.join(book_names)}"
 
-        print(f"ID: {self.id}, Books in Series: {', '.join(book_names)}")
-
-
+    def display_info(self):
+        print(self.describe())
+
+
+class TierPolicy:
+    """Discount, reward and reservation rules of one customer tier
+
+    Each tier is declared once with register() and looked up by customer_type, so
+    pricing, receipts, saving and reservations use one table lookup instead of
+    isinstance chains, and a new tier only needs a new registration.
+    """
+    _policies = {}
+
+    def __init__(self, customer_type, customer_class, discount=False, rewards=False, reservation_boost=0):
+        self.customer_type = customer_type
+        self.customer_class = customer_class
+        self.discount = discount  # gets the customer's discount rate off the original cost
+        self.rewards = rewards  # earns reward points and redeems them at 20 points per AUD
+        self.reservation_boost = reservation_boost  # how far ahead the tier queues for reservations
+
+    @classmethod
+    def register(cls, policy):
+        cls._policies[policy.customer_type] = policy
+        return policy
+
+    @classmethod
+    def for_type(cls, customer_type):
+        return cls._policies.get(customer_type)
+
+    @classmethod
+    def for_customer(cls, customer):
+        return cls._policies[customer.customer_type]
+
+    @classmethod
+    def all(cls):
+        """Every registered policy, in registration order"""
+        return list(cls._policies.values())
+
+    def discount_rate(self, customer, timestamp=None):
+        return customer.discount_rate_at(timestamp) if self.discount else 0
+
+    def reward_rate(self, customer, timestamp=None):
+        return customer.reward_rate_at(timestamp) if self.rewards else 0
+
+    def price(self, customer, original_cost, redeem_points=True, timestamp=None):
+        """Return (discount, reward, total cost) at the rates in effect at timestamp, without changing the customer"""
+        discount = customer.get_discount(original_cost, timestamp) if self.discount else 0
+        total_cost = original_cost - discount
+        reward = 0
+        if self.rewards:
+            reward = customer.get_reward(total_cost, timestamp)
+            if redeem_points:
+                total_cost -= (customer.reward_points // 20) * CENTS_PER_AUD
+        return discount, reward, total_cost
+
+    def parse_customer(self, customer_id, name, fields):
+        """Build a customer from the discount, reward rate and points fields of customers.txt"""
+        kwargs = {}
+        if self.discount:
+            kwargs['discount_rate'] = float(fields[0]) if fields[0] != 'na' else None
+        if self.rewards:
+            kwargs['reward_rate'] = float(fields[1]) if fields[1] != 'na' else 1.0
+            kwargs['reward_points'] = int(fields[2]) if fields[2] != 'na' else 0
+        return self.customer_class(customer_id, name, **kwargs)
+
+    def format_customer(self, customer):
+        discount_rate = customer.discount_rate if self.discount else 'na'
+        reward_rate = customer.reward_rate if self.rewards else 'na'
+        reward_points = customer.reward_points if self.rewards else 'na'
+        return f"{self.customer_type}, {customer.id}, {customer.name}, {discount_rate}, {reward_rate}, {reward_points}"
+
+TierPolicy.register(TierPolicy('C', Customer))
+TierPolicy.register(TierPolicy('M', Member, discount=True, reservation_boost=1))
+TierPolicy.register(TierPolicy('G', GoldMember, discount=True, rewards=True, reservation_boost=2))
 
 # Order Class
 class Rental:
     """Class representing a rental transaction with HD features"""
-    def __init__(self, customer, books_and_days, timestamp=None):
+    def __init__(self, customer, books_and_days, timestamp=None, apply_rewards=True, points_redeemed=0,
+                 quote=None):
         self.customer = customer
         self.books_and_days = books_and_days  # List of tuples (book, days)
         self.timestamp = timestamp if timestamp else datetime.now()
-        self.calculate_costs()
+        # Rentals loaded from history are already reflected in the saved reward balance
+        self.apply_rewards = apply_rewards
+        # For history, the points redeemed at the time; new rentals redeem the current balance
+        self.points_redeemed = points_redeemed
+        if quote is None:
+            self.calculate_costs()
+        else:
+            # Rentals from history keep what they were charged; RentalPricer.reprice prices them again
+            self.original_cost, self.discount, self.reward, self.total_cost = quote
 
     def calculate_costs(self):
-        """Calculate all cost components"""
-        # Calculate original cost
-        self.original_cost = sum(book.get_price(days) for book, days in self.books_and_days)
-
-        # Apply discount
-        if isinstance(self.customer, GoldMember):
-            self.discount = self.customer.get_discount(self.original_cost)
-            temp_total = self.original_cost - self.discount
-            self.reward = self.customer.get_reward(temp_total)
-
-            # Apply reward points deduction if applicable
-            points_to_use = (self.customer.reward_points // 20) * 20
-            if points_to_use > 0:
-                deduction = points_to_use / 20  # Every 20 points = 1 AUD
-                temp_total -= deduction
-                self.customer.reward_points -= points_to_use
-
-            self.total_cost = temp_total
+        """Calculate all cost components, in integer cents"""
+        quote = RentalPricer().quote(self.customer, self.books_and_days, redeem_points=self.apply_rewards,
+                                     timestamp=self.timestamp)
+        self.original_cost = quote.original_cost
+        self.discount = quote.discount
+        self.reward = quote.reward
+        self.total_cost = quote.total_cost
+
+        if self.apply_rewards and TierPolicy.for_customer(self.customer).rewards:
+            # Every 20 points = 1 AUD, already deducted in the quote
+            self.points_redeemed = (self.customer.reward_points // 20) * 20
+            self.customer.redeem_reward(self.points_redeemed, self.timestamp)
             # Still add new rewards even if we used some points
-            self.customer.update_reward(self.reward)
-
-        elif isinstance(self.customer, Member):
-            self.discount = self.customer.get_discount(self.original_cost)
-            self.total_cost = self.original_cost - self.discount
-        else:  # Regular customer
-            self.discount = 0
-            self.total_cost = self.original_cost
+            self.customer.update_reward(self.reward, self.timestamp)
+        elif self.points_redeemed:
+            self.total_cost -= self.points_redeemed // 20 * CENTS_PER_AUD
 
     def display_receipt(self):
         """Display detailed receipt for the rental"""
@@ -245,50 +665,1466 @@ class Rental:
                 print(f"- {book.name} for {days} days")
 
         print("---")
-        print(f"Original cost: {self.original_cost:.2f} (AUD)")
-        print(f"Discount: {self.discount:.2f} (AUD)")
-        print(f"Total cost: {self.total_cost:.2f} (AUD)")
-        if isinstance(self.customer, GoldMember):
+        print(f"Original cost: {format_cents(self.original_cost)} (AUD)")
+        print(f"Discount: {format_cents(self.discount)} (AUD)")
+        print(f"Total cost: {format_cents(self.total_cost)} (AUD)")
+        if TierPolicy.for_customer(self.customer).rewards:
             print(f"Reward earned: {self.reward}")
         print()
 
+RentalQuote = namedtuple('RentalQuote', ['original_cost', 'discount', 'reward', 'total_cost'])
+
+class RentalPricer:
+    """Side-effect free pricing of rental baskets"""
+    def __init__(self):
+        self._item_prices = {}  # (book id, days) -> price, valid for the lifetime of the pricer
+
+    def price_item(self, book, days):
+        key = (book.id, days)
+        price = self._item_prices.get(key)
+        if price is None:
+            price = book.get_price(days)
+            self._item_prices[key] = price
+        return price
+
+    def quote(self, customer, books_and_days, redeem_points=True, timestamp=None):
+        """Price one basket without creating a Rental or touching customer state
+
+        Discount and reward rates are those in effect at timestamp (default now). All
+        amounts are integer cents.
+        """
+        original_cost = sum(self.price_item(book, days) for book, days in books_and_days)
+        # Reward points are only read here, never redeemed
+        discount, reward, total_cost = TierPolicy.for_customer(customer).price(customer, original_cost, redeem_points,
+                                                                              timestamp)
+        return RentalQuote(original_cost, discount, reward, total_cost)
+
+    def reprice(self, rental):
+        """Price a past rental again at the rates in effect when it was made"""
+        quote = self.quote(rental.customer, rental.books_and_days, redeem_points=False, timestamp=rental.timestamp)
+        # Points redeemed at the time stay redeemed
+        return quote._replace(total_cost=quote.total_cost - rental.points_redeemed // 20 * CENTS_PER_AUD)
+
+    def quote_batch(self, baskets):
+        """Price many (customer, books_and_days) baskets, sharing item prices across the batch
+
+        Each basket is quoted independently against the customer's current state,
+        so a Gold member's points are applied to every basket as a what-if.
+        """
+        return [self.quote(customer, books_and_days) for customer, books_and_days in baskets]
+
+RevenueDelta = namedtuple('RevenueDelta', ['baseline', 'scenario', 'delta'])
+
+class RepricingSimulator:
+    """What-if revenue simulation over the full rental history
+
+    The history is compressed once into day totals per price tier for each (category,
+    customer type, discount rate, reward rate) bucket, so each scenario costs O(buckets)
+    instead of O(rentals). Revenue is taken before Gold reward point redemption, which
+    depends on each member's running balance rather than on prices, and before
+    per-category price caps.
+    """
+    def __init__(self, records):
+        self.records = records
+        self._buckets = {}  # key -> days in each price tier of the category
+        self.rental_count = 0
+        records.load_partitions()
+        for rental in records.rentals:
+            self._add_rental(rental)
+
+    def _add_rental(self, rental):
+        customer = rental.customer
+        policy = TierPolicy.for_customer(customer)
+        discount_rate = policy.discount_rate(customer, rental.timestamp)
+        reward_rate = policy.reward_rate(customer, rental.timestamp)
+        for book, days in rental.books_and_days:
+            if isinstance(book, BookSeries):
+                components = [(component, book.series_rate) for component in book.books if component]
+            else:
+                components = [(book, 1.0)]
+            for component, factor in components:
+                if not component.category:
+                    continue
+                schedule = component.category.schedule
+                key = (component.category.id, customer.customer_type, discount_rate, reward_rate)
+                bucket = self._buckets.setdefault(key, [0.0] * len(schedule.tiers))
+                for i, tier_days in enumerate(schedule.tier_days(days)):
+                    bucket[i] += factor * tier_days
+        self.rental_count += 1
+
+    def _revenue(self, prices=None, member_discount=None, gold_discount=None, reward_rate=None):
+        prices = prices or {}
+        by_category = defaultdict(float)
+        by_tier = defaultdict(float)
+        rewards = 0.0
+        for (category_id, customer_type, discount_rate, bucket_reward_rate), tier_days in self._buckets.items():
+            category = self.records.find_book_category(category_id)
+            rates = [price for price, last_day in category.schedule.tiers]
+            # Scenario prices replace the leading tiers' daily prices
+            for i, price in enumerate(prices.get(category_id, ())[:len(rates)]):
+                rates[i] = price
+
+            if customer_type == 'M' and member_discount is not None:
+                discount_rate = member_discount
+            elif customer_type == 'G' and gold_discount is not None:
+                discount_rate = gold_discount
+
+            revenue = sum(days * rate for days, rate in zip(tier_days, rates)) * (1 - discount_rate)
+            by_category[category_id] += revenue
+            by_tier[customer_type] += revenue
+            if customer_type == 'G':
+                rewards += revenue * (reward_rate if reward_rate is not None else bucket_reward_rate)
+        return by_category, by_tier, rewards
+
+    def run(self, prices=None, member_discount=None, gold_discount=None, reward_rate=None):
+        """Simulate one scenario against current prices and rates
+
+        prices maps category ID to daily prices for its leading tiers, e.g. a (price_1,
+        price_2) pair; any argument left as None
+        keeps its live value. No customer or category state is modified.
+        """
+        base_category, base_tier, base_rewards = self._revenue()
+        category, tier, rewards = self._revenue(prices, member_discount, gold_discount, reward_rate)
+
+        def deltas(baseline, scenario):
+            return {key: RevenueDelta(baseline[key], scenario[key], scenario[key] - baseline[key])
+                    for key in sorted(set(baseline) | set(scenario))}
+
+        base_total = sum(base_tier.values())
+        total = sum(tier.values())
+        return {
+            'by_category': deltas(base_category, category),
+            'by_tier': deltas(base_tier, tier),
+            'total': RevenueDelta(base_total, total, total - base_total),
+            'rewards': RevenueDelta(base_rewards, rewards, rewards - base_rewards),
+        }
+
+    def sweep(self, scenarios):
+        """Run many scenarios, each given as a dict of run() keyword arguments"""
+        return [self.run(**scenario) for scenario in scenarios]
+
+COMPRESSION_MAGIC = [(b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz')]
+COMPRESSION_EXTENSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+COMPRESSED_FILES = {'gzip': gzip.GzipFile, 'bz2': bz2.BZ2File, 'xz': lzma.LZMAFile}
+DATA_BUFFER_SIZE = 1 << 20
+
+def detect_compression(filename):
+    """'gzip', 'bz2' or 'xz' from an existing file's magic bytes, else from the extension; None if plain"""
+    try:
+        with open(filename, 'rb') as file:
+            head = file.read(6)
+        for magic, kind in COMPRESSION_MAGIC:
+            if head.startswith(magic):
+                return kind
+        if head:
+            return None
+    except FileNotFoundError:
+        pass
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+
+class CompressedLineReader:
+    """Lines of a gzip, bz2 or xz file, decompressed in large chunks
+
+    Splitting whole decompressed chunks is faster than reading line by line through the
+    decompressor's own small buffer. Iteration yields str lines, or bytes lines in binary
+    mode; seek() takes an offset into the decompressed data.
+    """
+    def __init__(self, filename, kind, binary=False):
+        self._file = COMPRESSED_FILES[kind](filename, 'rb')
+        self.binary = binary
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        self._file.close()
+
+    def seek(self, offset):
+        return self._file.seek(offset)
+
+    def read(self):
+        data = self._file.read()
+        return data if self.binary else data.decode()
+
+    def __iter__(self):
+        tail = b''
+        while True:
+            chunk = self._file.read(DATA_BUFFER_SIZE)
+            if not chunk:
+                break
+            chunk = tail + chunk
+            end = chunk.rfind(b'\n') + 1
+            tail = chunk[end:]
+            if not end:
+                continue
+            if self.binary:
+                for line in chunk[:end - 1].split(b'\n'):
+                    yield line + b'\n'
+            else:
+                for line in chunk[:end - 1].decode().split('\n'):
+                    yield line + '\n'
+        if tail:
+            yield tail if self.binary else tail.decode()
+
+def open_data_file(filename, mode='r'):
+    """Open a data file for reading, decompressing gzip, bz2 and xz transparently
+
+    Plain files are opened as usual, with a large buffer.
+    """
+    kind = detect_compression(filename)
+    if kind is None:
+        return open(filename, mode, buffering=DATA_BUFFER_SIZE)
+    return CompressedLineReader(filename, kind, binary='b' in mode)
+
+class SymbolTable:
+    """Shared storage for repeated strings such as IDs and names
+
+    Each distinct string is kept once and numbered, so bulk structures can hold small
+    integers (e.g. in typed arrays) and turn them back into strings only for display.
+    """
+    def __init__(self):
+        self._symbols = {}  # text -> symbol
+        self._texts = []  # symbol -> text
+
+    def __len__(self):
+        return len(self._texts)
+
+    def intern(self, text):
+        """Return the symbol of text, adding it if new"""
+        symbol = self._symbols.get(text)
+        if symbol is None:
+            symbol = self._symbols[text] = len(self._texts)
+            self._texts.append(text)
+        return symbol
+
+    def symbol(self, text):
+        """Symbol of text, or None if it was never interned"""
+        return self._symbols.get(text)
+
+    def text(self, symbol):
+        return self._texts[symbol]
+
+    def canonical(self, text):
+        """The shared copy of text, so equal strings from many lines are stored once"""
+        return self._texts[self.intern(text)]
+
+    def memory_size(self):
+        return (sys.getsizeof(self._symbols) + sys.getsizeof(self._texts) +
+                sum(sys.getsizeof(text) for text in self._texts))
+
+class RentalFileIndex:
+    """Line-offset index over a memory-mapped rental file
+
+    The index is persisted next to the rental file as <rental_file>.idx and is rebuilt
+    whenever the rental file's size or modification time no longer match.
+    """
+    INDEX_HEADER = struct.Struct('<4sQQQ')  # magic, file size, mtime (ns), line count
+    INDEX_MAGIC = b'RIX1'
+
+    def __init__(self, rental_file, symbols=None):
+        self.rental_file = rental_file
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        self.index_file = rental_file + '.idx'
+        self._file = open(rental_file, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self._size = stat.st_size
+        self._mtime = stat.st_mtime_ns
+        # mmap cannot map an empty file
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._size else b''
+        self.offsets = array('Q')  # start of every line, plus the end of the file
+        self.customer_symbols = array('I')  # customer ID of every line, as a symbol
+        if not self._load_index():
+            self._build_index()
+            self._save_index()
+
+        self._customer_lines = defaultdict(lambda: array('I'))  # customer symbol -> line numbers
+        for line_no, symbol in enumerate(self.customer_symbols):
+            self._customer_lines[symbol].append(line_no)
+
+    def _build_index(self):
+        data = self._map
+        pos = 0
+        while pos < self._size:
+            end = data.find(b'\n', pos)
+            if end == -1:
+                end = self._size
+            comma = data.find(b',', pos, end)
+            self.offsets.append(pos)
+            self.customer_symbols.append(self.symbols.intern(data[pos:comma if comma != -1 else end].decode().strip()))
+            pos = end + 1
+        self.offsets.append(self._size)
+
+    def _load_index(self):
+        try:
+            with open(self.index_file, 'rb') as file:
+                magic, size, mtime, count = self.INDEX_HEADER.unpack(file.read(self.INDEX_HEADER.size))
+                if magic != self.INDEX_MAGIC or size != self._size or mtime != self._mtime:
+                    return False
+                self.offsets.fromfile(file, count + 1)
+                blob = file.read()
+        except (OSError, struct.error, EOFError):
+            self.offsets = array('Q')
+            return False
+        intern = self.symbols.intern
+        self.customer_symbols = array('I', (intern(customer_id) for customer_id in blob.decode().split('\n'))
+                                      if count else ())
+        return True
+
+    def _save_index(self):
+        try:
+            with open(self.index_file, 'wb') as file:
+                file.write(self.INDEX_HEADER.pack(self.INDEX_MAGIC, self._size, self._mtime, len(self.customer_symbols)))
+                self.offsets.tofile(file)
+                file.write('\n'.join(map(self.symbols.text, self.customer_symbols)).encode())
+        except OSError as e:
+            print(f"Could not save rental index {self.index_file}: {e}")
+
+    def __len__(self):
+        return len(self.customer_symbols)
+
+    def customer_id(self, line_no):
+        return self.symbols.text(self.customer_symbols[line_no])
+
+    def line(self, line_no):
+        return self._map[self.offsets[line_no]:self.offsets[line_no + 1]].decode().rstrip('\r\n')
+
+    def rows(self, line_numbers=None):
+        """Yield the split fields of the given lines (all lines by default)"""
+        if line_numbers is None:
+            line_numbers = range(len(self))
+        for line_no in line_numbers:
+            parts = [part.strip() for part in self.line(line_no).split(',')]
+            if len(parts) >= 7:
+                yield parts
+
+    def customer_lines(self, customer_id):
+        symbol = self.symbols.symbol(customer_id)
+        return self._customer_lines.get(symbol, ()) if symbol is not None else ()
+
+    def memory_size(self):
+        """Bytes held by the per-line customer IDs and per-customer line lists"""
+        return (self.customer_symbols.itemsize * len(self.customer_symbols) + sys.getsizeof(self._customer_lines) +
+                sum(sys.getsizeof(lines) for lines in self._customer_lines.values()))
+
+    def close(self):
+        if self._size:
+            self._map.close()
+        self._file.close()
+
+class RecordWriter:
+    """Batched, atomic writer for data files
+
+    Lines are joined in large batches and written to a temporary file in the target's
+    directory, which replaces the target only once everything is on disk, so a crash
+    mid-save leaves the previous file intact; a failed append is truncated back to the
+    old end of the file. An existing target keeps the compression its magic bytes show,
+    as readers see it, and a new .gz, .bz2 or .xz target is compressed; appends to a
+    compressed file add a new compressed stream, which readers continue through.
+    """
+    BATCH_SIZE = 10000
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, filename, append=False, binary=False):
+        self.filename = filename
+        self.append = append  # appends go straight to the file; they cannot truncate it
+        self.binary = binary
+        self.bytes_written = 0
+        self.elapsed = 0.0
+        self._batch = []
+        self._last_timestamp = None
+        self._last_timestamp_text = None
+        self._file = None
+        self._raw = None  # the file on disk, under any compressor and text layer
+        self._compressor = None
+        self._temp_name = None
+        self._start_size = 0
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        kind = detect_compression(self.filename)
+        if self.append:
+            self._raw = open(self.filename, 'ab', buffering=self.BUFFER_SIZE)
+            self._start_size = self._raw.tell()
+            # Hand-edited files may lack a final newline; the first new line must not join it
+            if not kind and not self.binary and self._start_size and not self._ends_with_newline():
+                self._raw.write(b'\n')
+        else:
+            directory = os.path.dirname(os.path.abspath(self.filename))
+            fd, self._temp_name = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(self.filename)}.", suffix=".tmp")
+            self._raw = os.fdopen(fd, 'wb', buffering=self.BUFFER_SIZE)
+        stream = self._raw
+        if kind == 'gzip':
+            # GzipFile only takes a file object by keyword
+            self._compressor = stream = gzip.GzipFile(fileobj=stream, mode='wb')
+        elif kind:
+            self._compressor = stream = COMPRESSED_FILES[kind](stream, 'wb')
+        self._file = stream if self.binary else io.TextIOWrapper(stream, write_through=True)
+        return self
+
+    def _ends_with_newline(self):
+        with open(self.filename, 'rb') as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b'\n'
+
+    def _close(self):
+        if not self.binary:
+            self._file.flush()
+            self._file.detach()
+        if self._compressor:
+            self._compressor.close()
+        self._raw.flush()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._close()
+            self._raw.close()
+            if self.append:
+                # Drop whatever part of the append reached the file
+                os.truncate(self.filename, self._start_size)
+            else:
+                os.remove(self._temp_name)
+            return False
+
+        self._flush_batch()
+        self._close()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        if self.append:
+            self.bytes_written = os.path.getsize(self.filename) - self._start_size
+            self.elapsed = time.perf_counter() - self._started
+            return False
+        if os.path.exists(self.filename):
+            shutil.copymode(self.filename, self._temp_name)
+        else:
+            #mkstemp creates files as 0600; new data files get the usual umask default
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(self._temp_name, 0o666 & ~umask)
+        self.bytes_written = os.path.getsize(self._temp_name)
+        os.replace(self._temp_name, self.filename)
+        self.elapsed = time.perf_counter() - self._started
+        return False
+
+    def _flush_batch(self):
+        if self._batch:
+            self._file.write(''.join(self._batch))
+            self._batch = []
+
+    def write_line(self, line):
+        self._batch.append(line)
+        self._batch.append('\n')
+        if len(self._batch) >= self.BATCH_SIZE * 2:
+            self._flush_batch()
+
+    def write_lines(self, lines):
+        for line in lines:
+            self.write_line(line)
+
+    def write_bytes(self, data):
+        #Binary writers only
+        self._file.write(data)
+
+    def format_timestamp(self, timestamp):
+        #Consecutive rentals made in the same second share one formatted string
+        if timestamp != self._last_timestamp:
+            self._last_timestamp = timestamp
+            self._last_timestamp_text = timestamp.strftime('%d/%m/%Y %H:%M:%S')
+        return self._last_timestamp_text
+
+    @property
+    def mb_per_sec(self):
+        if not self.elapsed:
+            return 0.0
+        return self.bytes_written / (1024 * 1024) / self.elapsed
+
+    def report(self):
+        return f"{self.filename}: {self.bytes_written / (1024 * 1024):.2f} MB in {self.elapsed:.3f}s ({self.mb_per_sec:.1f} MB/s)"
+
+class RentalExporter:
+    """Columnar export of rental history for analysis
+
+    Writes Parquet when pyarrow is installed, otherwise a NumPy .npz archive built with
+    the standard library (numpy.load reads it). Rentals are exported in row groups of
+    row_group_size, so only one group of columns is held in memory at a time.
+
+    .npz layout, for each row group NNNNN (zero padded, in rental order):
+        rgNNNNN/customer_id    unicode  customer ID per rental
+        rgNNNNN/customer_type  unicode  'C', 'M' or 'G'
+        rgNNNNN/book_offsets   int64    rental i owns book_ids[book_offsets[i]:book_offsets[i+1]]
+        rgNNNNN/book_ids       unicode  book or series ID per rented item
+        rgNNNNN/days           int64    borrowing days per rented item
+        rgNNNNN/original_cost  float64  AUD
+        rgNNNNN/discount       float64  AUD
+        rgNNNNN/total_cost     float64  AUD
+        rgNNNNN/reward         int64    -1 when the customer earns no rewards
+        rgNNNNN/timestamp      int64    seconds since the epoch
+    """
+    COLUMNS = ['customer_id', 'customer_type', 'book_ids', 'days', 'original_cost',
+               'discount', 'total_cost', 'reward', 'timestamp']
+
+    def __init__(self, records, row_group_size=65536):
+        self.records = records
+        self.row_group_size = row_group_size
+
+    def _row_groups(self):
+        self.records.load_partitions()
+        rentals = iter(self.records.rentals)
+        while True:
+            chunk = list(islice(rentals, self.row_group_size))
+            if not chunk:
+                return
+            columns = {name: [] for name in self.COLUMNS}
+            for rental in chunk:
+                customer = rental.customer
+                columns['customer_id'].append(customer.id)
+                columns['customer_type'].append(customer.customer_type)
+                columns['book_ids'].append([book.id for book, days in rental.books_and_days])
+                columns['days'].append([days for book, days in rental.books_and_days])
+                columns['original_cost'].append(rental.original_cost / CENTS_PER_AUD)
+                columns['discount'].append(rental.discount / CENTS_PER_AUD)
+                columns['total_cost'].append(rental.total_cost / CENTS_PER_AUD)
+                columns['reward'].append(rental.reward if TierPolicy.for_customer(customer).rewards else -1)
+                columns['timestamp'].append(int(rental.timestamp.timestamp()))
+            yield columns
+
+    def export(self, filename, format=None):
+        """Export to filename as 'parquet' or 'npz' (Parquet if available by default)"""
+        if format is None:
+            try:
+                import pyarrow  # noqa: F401
+                format = 'parquet'
+            except ImportError:
+                format = 'npz'
+
+        if format == 'parquet':
+            return self._export_parquet(filename)
+        elif format == 'npz':
+            return self._export_npz(filename)
+        raise ValueError(f"Unknown export format: {format}")
+
+    def _export_parquet(self, filename):
+        import pyarrow
+        import pyarrow.parquet
+
+        schema = pyarrow.schema([
+            ('customer_id', pyarrow.string()),
+            ('customer_type', pyarrow.string()),
+            ('book_ids', pyarrow.list_(pyarrow.string())),
+            ('days', pyarrow.list_(pyarrow.int64())),
+            ('original_cost', pyarrow.float64()),
+            ('discount', pyarrow.float64()),
+            ('total_cost', pyarrow.float64()),
+            ('reward', pyarrow.int64()),
+            ('timestamp', pyarrow.int64()),
+        ])
+        rows = 0
+        with pyarrow.parquet.ParquetWriter(filename, schema) as writer:
+            for columns in self._row_groups():
+                writer.write_table(pyarrow.table(columns, schema=schema))
+                rows += len(columns['customer_id'])
+        return rows
+
+    def _export_npz(self, filename):
+        rows = 0
+        with zipfile.ZipFile(filename, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for group, columns in enumerate(self._row_groups()):
+                offsets = [0]
+                for book_ids in columns['book_ids']:
+                    offsets.append(offsets[-1] + len(book_ids))
+                arrays = {
+                    'customer_id': columns['customer_id'],
+                    'customer_type': columns['customer_type'],
+                    'book_offsets': array('q', offsets),
+                    'book_ids': [book_id for book_ids in columns['book_ids'] for book_id in book_ids],
+                    'days': array('q', (days for group_days in columns['days'] for days in group_days)),
+                    'original_cost': array('d', columns['original_cost']),
+                    'discount': array('d', columns['discount']),
+                    'total_cost': array('d', columns['total_cost']),
+                    'reward': array('q', columns['reward']),
+                    'timestamp': array('q', columns['timestamp']),
+                }
+                for name, values in arrays.items():
+                    with archive.open(f"rg{group:05d}/{name}.npy", 'w', force_zip64=True) as member:
+                        self._write_npy(member, values)
+                rows += len(columns['customer_id'])
+        return rows
+
+    @staticmethod
+    def _write_npy(file, values):
+        #Write a 1-D .npy array: typed arrays as raw data, string lists as fixed-width UTF-32
+        if isinstance(values, array):
+            descr = '<f8' if values.typecode == 'd' else '<i8'
+            if sys.byteorder != 'little':
+                values = array(values.typecode, values)
+                values.byteswap()
+            data = values.tobytes()
+        else:
+            width = max((len(value) for value in values), default=1) or 1
+            descr = f'<U{width}'
+            data = b''.join(value.ljust(width, '\0').encode('utf-32-le') for value in values)
+        header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({len(values)},), }}"
+        # Magic, version and header length take 10 bytes; pad the header to a multiple of 64
+        header = header.ljust(63 - (10 + len(header)) % 64 + len(header)) + '\n'
+        file.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1'))
+        file.write(data)
+
+class RevenueRollup:
+    """Running revenue, discount and reward totals per day, month, category and customer type
+
+    Each bucket holds [revenue, discount, rewards, rentals], with revenue and discount in
+    cents. A rental's revenue and discount are shared between categories in proportion
+    to each item's original price, the last item taking the rounding remainder so that
+    category totals add up to the other dimensions exactly.
+    """
+    DIMENSIONS = ('day', 'month', 'category', 'customer_type')
+
+    def __init__(self):
+        self.buckets = {dimension: {} for dimension in self.DIMENSIONS}
+
+    def _add(self, dimension, key, revenue, discount, rewards, rentals):
+        bucket = self.buckets[dimension].setdefault(key, [0, 0, 0, 0])
+        bucket[0] += revenue
+        bucket[1] += discount
+        bucket[2] += rewards
+        bucket[3] += rentals
+
+    def add_rental(self, rental):
+        day = rental.timestamp.strftime('%Y-%m-%d')
+        totals = (rental.total_cost, rental.discount, rental.reward, 1)
+        self._add('day', day, *totals)
+        self._add('month', day[:7], *totals)
+        self._add('customer_type', rental.customer.customer_type, *totals)
+
+        if not rental.original_cost:
+            return
+        prices = [book.get_price(days) for book, days in rental.books_and_days]
+        last = max(i for i, price in enumerate(prices) if price)
+        revenue_left, discount_left = rental.total_cost, rental.discount
+        for i, ((book, days), price) in enumerate(zip(rental.books_and_days, prices)):
+            if i == last:
+                revenue, discount = revenue_left, discount_left
+            else:
+                revenue = rental.total_cost * price // rental.original_cost
+                discount = rental.discount * price // rental.original_cost
+                revenue_left -= revenue
+                discount_left -= discount
+            # All books of a series share a category
+            category_book = book.books[0] if isinstance(book, BookSeries) and book.books else book
+            category = getattr(category_book, 'category', None)
+            if not category:
+                continue
+            share = price / rental.original_cost
+            self._add('category', category.id, revenue, discount, rental.reward * share, share)
+
+    def totals(self, dimension):
+        """Return {bucket key: (revenue, discount, rewards, rentals)} for one dimension"""
+        return {key: tuple(bucket) for key, bucket in sorted(self.buckets[dimension].items())}
+
+    def save(self, filename):
+        with RecordWriter(filename) as writer:
+            for dimension in self.DIMENSIONS:
+                for key, (revenue, discount, rewards, rentals) in sorted(self.buckets[dimension].items()):
+                    writer.write_line(f"{dimension}, {key}, {format_cents(revenue)}, {format_cents(discount)}, "
+                                      f"{rewards:.2f}, {rentals:.2f}")
+        return [writer]
+
+    def read(self, filename):
+        self.buckets = {dimension: {} for dimension in self.DIMENSIONS}
+        with open_data_file(filename) as file:
+            for line in file:
+                parts = [part.strip() for part in line.split(',')]
+                if len(parts) != 6 or parts[0] not in self.buckets:
+                    continue
+                try:
+                    self.buckets[parts[0]][parts[1]] = ([to_cents(value) for value in parts[2:4]] +
+                                                        [float(value) for value in parts[4:]])
+                except ValueError:
+                    print(f"Error processing rollup line: {line.strip()}")
+
+def parse_listing_options(text):
+    """Parse '--limit N --offset N --match TEXT --out FILE' paging options; None if invalid"""
+    parser = argparse.ArgumentParser(prog="listing", add_help=False, exit_on_error=False)
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--offset', type=int, default=0)
+    parser.add_argument('--match')
+    parser.add_argument('--out')
+    try:
+        options, unknown = parser.parse_known_args(shlex.split(text))
+    except (argparse.ArgumentError, ValueError) as e:
+        print(f"Invalid listing options: {e}")
+        return None
+    if unknown:
+        print(f"Invalid listing options: unrecognized {' '.join(unknown)}")
+        return None
+    if options.offset < 0 or (options.limit is not None and options.limit < 0):
+        print("Invalid listing options: limit and offset cannot be negative")
+        return None
+    return options
+
+class PagedOutput:
+    """Paged listing output through one buffered writer, to the terminal or a file"""
+    BATCH_SIZE = 1000
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, limit=None, offset=0, match=None, out=None):
+        self.limit = limit
+        self.offset = offset
+        self.match = match.lower() if match else None
+        self.out = out
+        self._opened = False  # later renders of one listing append to out
+
+    @classmethod
+    def from_options(cls, options):
+        if options is None:
+            return cls()
+        return cls(options.limit, options.offset, options.match, options.out)
+
+    def render(self, header, entries, footer="\n"):
+        """Write header, the selected page of entries (each ending in a newline) and footer"""
+        if self.match:
+            entries = (entry for entry in entries if self.match in entry.lower())
+        stop = None if self.limit is None else self.offset + self.limit
+
+        if self.out:
+            stream = open(self.out, 'a' if self._opened else 'w', buffering=self.BUFFER_SIZE)
+            self._opened = True
+        else:
+            stream = sys.stdout
+        shown = 0
+        try:
+            stream.write(header)
+            batch = []
+            for entry in islice(entries, self.offset, stop):
+                batch.append(entry)
+                shown += 1
+                if len(batch) >= self.BATCH_SIZE:
+                    stream.write(''.join(batch))
+                    batch = []
+            stream.write(''.join(batch))
+            stream.write(footer)
+        finally:
+            if self.out:
+                stream.close()
+                print(f"Wrote {shown} entries to {self.out}")
+            else:
+                stream.flush()
+        return shown
+
+Loan = namedtuple('Loan', ['loan_id', 'customer_id', 'book_id', 'due'])
+
+class DueDateScheduler:
+    """Timer wheel that fires an overdue event once per active loan
+
+    Loans are bucketed by the tick (one hour by default) in which they fall due, and a
+    heap holds only the ticks that have a bucket, so advancing the clock visits just
+    the loans coming due instead of every rental in the history.
+    """
+    def __init__(self, tick_seconds=3600):
+        self.tick_seconds = tick_seconds
+        self.now = None  # POSIX time the scheduler has been advanced to
+        self._buckets = {}  # tick -> loans due within it
+        self._ticks = []  # heap of ticks that have a bucket
+        self._pending = set()  # IDs of scheduled loans that have not fired or been cancelled
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """callback(loans) is called with each batch of loans that became overdue"""
+        self._listeners.append(callback)
+
+    def schedule(self, loan):
+        tick = int(loan.due // self.tick_seconds)
+        bucket = self._buckets.get(tick)
+        if bucket is None:
+            bucket = self._buckets[tick] = []
+            heapq.heappush(self._ticks, tick)
+        bucket.append(loan)
+        self._pending.add(loan.loan_id)
+
+    def cancel(self, loan_id):
+        self._pending.discard(loan_id)
+
+    def clear(self):
+        self._buckets.clear()
+        self._ticks = []
+        self._pending.clear()
+
+    def advance(self, now=None, batch_size=1000):
+        """Move the clock to now (default: the current time) and fire what fell due
+
+        Returns the overdue loans, which listeners also receive in batches of batch_size.
+        """
+        now = (now if now else datetime.now()).timestamp()
+        self.now = now if self.now is None else max(self.now, now)
+        now_tick = int(self.now // self.tick_seconds)
+
+        fired = []
+        while self._ticks and self._ticks[0] <= now_tick:
+            tick = self._ticks[0]
+            bucket = self._buckets[tick]
+            if tick < now_tick:
+                due, later = bucket, []
+            else:
+                # The current tick is only partly over
+                due = [loan for loan in bucket if loan.due <= self.now]
+                later = [loan for loan in bucket if loan.due > self.now]
+            for loan in due:
+                if loan.loan_id in self._pending:
+                    self._pending.discard(loan.loan_id)
+                    fired.append(loan)
+            if later:
+                self._buckets[tick] = later
+                break
+            heapq.heappop(self._ticks)
+            del self._buckets[tick]
+
+        for start in range(0, len(fired), batch_size):
+            batch = fired[start:start + batch_size]
+            for callback in self._listeners:
+                callback(batch)
+        return fired
+
+class Inventory:
+    """Copy counts per book and the active loans, indexed by due date
+
+    Active loans sit in a min-heap keyed on their due time (POSIX seconds). Returned
+    loans are dropped from the heap lazily and the heap is compacted once most of it
+    is stale, so checkout and return stay O(log n).
+    """
+    def __init__(self):
+        self._copies = {}  # book id -> copies owned
+        self._on_loan = defaultdict(int)  # book id -> copies currently out
+        self._loans = {}  # loan id -> Loan, active loans only
+        self._customer_loans = defaultdict(deque)  # (customer id, book id) -> loan ids, oldest first, may hold returned IDs
+        self._due_heap = []  # (due, loan id)
+        self._next_loan_id = 1
+        self.scheduler = DueDateScheduler()
+        self._holds = defaultdict(dict)  # book id -> {customer id: copies held for them}
+        self._held = defaultdict(int)  # book id -> copies held in total
+
+    def add_book(self, book):
+        if isinstance(book, Book):
+            self._copies[book.id] = book.copies
+
+    def _components(self, book):
+        #Renting a series takes one copy of each of its books
+        if isinstance(book, BookSeries):
+            return [component for component in book.books if component]
+        return [book]
+
+    def available_copies(self, book_id, customer_id=None):
+        """Copies on the shelf that customer_id may take, counting copies held for them"""
+        available = self._copies.get(book_id, 0) - self._on_loan.get(book_id, 0) - self._held.get(book_id, 0)
+        if customer_id is not None:
+            available += self._holds.get(book_id, {}).get(customer_id, 0)
+        return available
+
+    def _demand(self, books_and_days):
+        #Copies of each book a basket takes
+        demand = defaultdict(int)
+        for book, days in books_and_days:
+            for component in self._components(book):
+                demand[component.id] += 1
+        return demand
+
+    def is_available(self, book, customer_id=None, basket=()):
+        """True if a copy of book (every book of a series) is left after the items already in basket"""
+        taken = self._demand(basket)
+        return all(self.available_copies(component.id, customer_id) > taken[component.id]
+                   for component in self._components(book))
+
+    def can_checkout(self, books_and_days, customer_id=None):
+        """True if every item of a basket can be lent at once"""
+        return all(self.available_copies(book_id, customer_id) >= count
+                   for book_id, count in self._demand(books_and_days).items())
+
+    def hold(self, book_id, customer_id):
+        """Set a returned copy aside for a customer"""
+        holds = self._holds[book_id]
+        holds[customer_id] = holds.get(customer_id, 0) + 1
+        self._held[book_id] += 1
+
+    def _release_hold(self, book_id, customer_id):
+        holds = self._holds.get(book_id)
+        if not holds or customer_id not in holds:
+            return False
+        holds[customer_id] -= 1
+        if not holds[customer_id]:
+            del holds[customer_id]
+        if not holds:
+            del self._holds[book_id]
+        self._held[book_id] -= 1
+        return True
+
+    def holds(self):
+        """Yield (book id, customer id) once per held copy"""
+        for book_id, holds in self._holds.items():
+            for customer_id, count in holds.items():
+                for _ in range(count):
+                    yield book_id, customer_id
+
+    def checkout(self, customer_id, book, days, timestamp=None, strict=True):
+        """Lend one copy of book (every book of a series) and return the new loan IDs"""
+        components = self._components(book)
+        if strict:
+            for component in components:
+                if self.available_copies(component.id, customer_id) <= 0:
+                    raise BookUnavailableError(f"No copies of {component.name} are available")
+
+        timestamp = timestamp if timestamp else datetime.now()
+        due = (timestamp + timedelta(days=days)).timestamp()
+        loan_ids = []
+        for component in components:
+            # A copy held for this customer is the one they take
+            self._release_hold(component.id, customer_id)
+            loan = Loan(self._next_loan_id, customer_id, component.id, due)
+            self._next_loan_id += 1
+            self._loans[loan.loan_id] = loan
+            self._customer_loans[(customer_id, component.id)].append(loan.loan_id)
+            self._on_loan[component.id] += 1
+            heapq.heappush(self._due_heap, (due, loan.loan_id))
+            self.scheduler.schedule(loan)
+            loan_ids.append(loan.loan_id)
+        return loan_ids
+
+    def checkout_rental(self, rental, as_of=None):
+        """Track a rental's loans, skipping items already due by as_of
+
+        Returns are not recorded in the rental file, so when loans are rebuilt from
+        history anything past its due date is assumed to be back on the shelf.
+        """
+        for book, days in rental.books_and_days:
+            due = rental.timestamp + timedelta(days=days)
+            if as_of is None or due > as_of:
+                self.checkout(rental.customer.id, book, days, rental.timestamp, strict=False)
+
+    def return_loan(self, loan_id):
+        loan = self._loans.pop(loan_id, None)
+        if loan is None:
+            return None
+        self._on_loan[loan.book_id] -= 1
+        self.scheduler.cancel(loan_id)
+        if len(self._due_heap) > 2 * len(self._loans) + 64:
+            self._due_heap = [(due, loan_id) for due, loan_id in self._due_heap if loan_id in self._loans]
+            heapq.heapify(self._due_heap)
+        return loan
+
+    def return_book(self, customer_id, book):
+        """Return the customer's earliest loan of book (every book of a series)"""
+        returned = []
+        for component in self._components(book):
+            key = (customer_id, component.id)
+            loan_ids = self._customer_loans.get(key)
+            # Skip loans already returned by ID
+            while loan_ids and loan_ids[0] not in self._loans:
+                loan_ids.popleft()
+            if loan_ids:
+                returned.append(self.return_loan(loan_ids.popleft()))
+            if key in self._customer_loans and not loan_ids:
+                del self._customer_loans[key]
+        return returned
+
+    def active_loans(self):
+        return list(self._loans.values())
+
+    def clear_loans(self):
+        self._on_loan.clear()
+        self._loans.clear()
+        self._customer_loans.clear()
+        self._due_heap = []
+        self.scheduler.clear()
+
+    def overdue(self, as_of=None):
+        """Active loans due at or before as_of (default now), earliest first
+
+        Walks only the heap nodes due by as_of, since a node's children are never due
+        earlier, so the cost is proportional to the answer rather than to all loans.
+        """
+        as_of = (as_of if as_of else datetime.now()).timestamp()
+        heap = self._due_heap
+        found = []
+        stack = [0] if heap else []
+        while stack:
+            i = stack.pop()
+            due, loan_id = heap[i]
+            if due > as_of:
+                continue
+            if loan_id in self._loans:
+                found.append(self._loans[loan_id])
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    stack.append(child)
+        found.sort(key=lambda loan: loan.due)
+        return found
+
+class ReservationQueue:
+    """Waiting list for one book
+
+    Gold members are served before Members, and Members before Customers, but a
+    reservation only jumps ahead of at most PRIORITY_WINDOW earlier reservations per
+    tier, so lower tiers are never starved. Within a tier it is first come, first served.
+    """
+    PRIORITY_WINDOW = 100
+
+    def __init__(self):
+        self._heap = []  # (priority, sequence, customer id)
+        self._waiting = {}  # customer id -> sequence of their live reservation
+        self._next_sequence = 0
+
+    def __len__(self):
+        return len(self._waiting)
+
+    def __contains__(self, customer_id):
+        return customer_id in self._waiting
+
+    def reserve(self, customer_id, customer_type, sequence=None):
+        if customer_id in self._waiting:
+            return False
+        if sequence is None:
+            sequence = self._next_sequence
+        self._next_sequence = max(self._next_sequence, sequence + 1)
+        policy = TierPolicy.for_type(customer_type)
+        boost = policy.reservation_boost if policy else 0
+        priority = sequence - boost * self.PRIORITY_WINDOW
+        heapq.heappush(self._heap, (priority, sequence, customer_id))
+        self._waiting[customer_id] = sequence
+        return True
+
+    def cancel(self, customer_id):
+        #The heap entry is discarded when it reaches the top
+        return self._waiting.pop(customer_id, None) is not None
+
+    def pop(self):
+        while self._heap:
+            priority, sequence, customer_id = heapq.heappop(self._heap)
+            if self._waiting.get(customer_id) == sequence:
+                del self._waiting[customer_id]
+                return customer_id
+        return None
+
+    def entries(self):
+        """(sequence, customer id) of live reservations, in arrival order"""
+        return sorted((sequence, customer_id) for customer_id, sequence in self._waiting.items())
+
+class Reservations:
+    """Reservation queues per book, handing returned copies to the next in line"""
+    def __init__(self, inventory):
+        self.inventory = inventory
+        self._queues = {}  # book id -> ReservationQueue
+
+    def reserve(self, book, customer):
+        """Queue customer for book (every book of a series); True if newly queued for any"""
+        components = book.books if isinstance(book, BookSeries) else [book]
+        queued = False
+        for component in components:
+            queue = self._queues.setdefault(component.id, ReservationQueue())
+            queued = queue.reserve(customer.id, customer.customer_type) or queued
+        return queued
+
+    def restore(self, book_id, customer, sequence):
+        """Queue customer for one book at their saved place in line"""
+        queue = self._queues.setdefault(book_id, ReservationQueue())
+        return queue.reserve(customer.id, customer.customer_type, sequence)
+
+    def cancel(self, book_id, customer_id):
+        queue = self._queues.get(book_id)
+        return bool(queue) and queue.cancel(customer_id)
+
+    def queue_length(self, book_id):
+        queue = self._queues.get(book_id)
+        return len(queue) if queue else 0
+
+    def hand_off(self, book_id):
+        """Hold a returned copy for the next customer in line; returns their ID"""
+        queue = self._queues.get(book_id)
+        if not queue:
+            return None
+        customer_id = queue.pop()
+        if not queue:
+            del self._queues[book_id]
+        if customer_id is not None:
+            self.inventory.hold(book_id, customer_id)
+        return customer_id
+
+    def entries(self):
+        for book_id, queue in self._queues.items():
+            for sequence, customer_id in queue.entries():
+                yield book_id, customer_id, sequence
+
+class CoRentalIndex:
+    """Sparse book x book co-rental counts: "customers who rented X also rented Y"
+
+    A pair is counted once per customer who has rented both books, at any time; a
+    series counts as each of its books. Counts only ever grow, so each book's top
+    CACHE_SIZE list is kept exact as rentals arrive instead of being recomputed, and
+    a query is a lookup in that list once the book has been asked for.
+    """
+    CACHE_SIZE = 20
+
+    def __init__(self):
+        self._counts = defaultdict(dict)  # book id -> {other book id: customers who rented both}
+        self._customer_books = defaultdict(set)  # customer id -> IDs of every book they rented
+        self._top = {}  # book id -> [(-count, other book id)] best first, for books queried so far
+        self._books = {}  # book id -> Book, for every book rented
+
+    @staticmethod
+    def _components(book):
+        if isinstance(book, BookSeries):
+            return [component for component in book.books if component]
+        return [book]
+
+    def add_rental(self, rental):
+        seen = self._customer_books[rental.customer.id]
+        for book, days in rental.books_and_days:
+            for component in self._components(book):
+                book_id = component.id
+                self._books[book_id] = component
+                if book_id in seen:
+                    continue
+                for other_id in seen:
+                    self._increment(book_id, other_id)
+                    self._increment(other_id, book_id)
+                seen.add(book_id)
+
+    def _increment(self, book_id, other_id):
+        row = self._counts[book_id]
+        count = row[other_id] = row.get(other_id, 0) + 1
+        top = self._top.get(book_id)
+        if top is None:
+            return
+        # Only other_id moved up, so it either moves within the list or displaces the last entry
+        entry = (-count, other_id)
+        for i, (negative_count, top_id) in enumerate(top):
+            if top_id == other_id:
+                top[i] = entry
+                break
+        else:
+            if len(top) < self.CACHE_SIZE:
+                top.append(entry)
+            elif entry < top[-1]:
+                top[-1] = entry
+            else:
+                return
+        top.sort()
+
+    def _top_list(self, book_id):
+        top = self._top.get(book_id)
+        if top is None:
+            row = self._counts.get(book_id, {})
+            top = self._top[book_id] = heapq.nsmallest(self.CACHE_SIZE, ((-count, other_id)
+                                                                         for other_id, count in row.items()))
+        return top
+
+    def similar(self, book, n=5, exclude=()):
+        """Return up to n (book, count) pairs most often co-rented with book, best first
+
+        For a series the lists of its books are merged, leaving out the series' own books.
+        exclude holds book IDs to leave out. At most CACHE_SIZE candidates per book are
+        considered.
+        """
+        book_ids = [component.id for component in self._components(book)]
+        skip = set(book_ids) | set(exclude)
+        if len(book_ids) == 1:
+            candidates = ((other_id, -negative_count) for negative_count, other_id in self._top_list(book_ids[0]))
+        else:
+            merged = defaultdict(int)
+            for book_id in book_ids:
+                for negative_count, other_id in self._top_list(book_id):
+                    merged[other_id] -= negative_count
+            candidates = sorted(merged.items(), key=lambda item: (-item[1], item[0]))
+        return list(islice(((self._books[other_id], count) for other_id, count in candidates
+                            if other_id not in skip), n))
+
 # Records Class
+class BloomFilter:
+    """Fixed-size Bloom filter over 64-bit hashes
+
+    A miss means the hash was never added; a hit may be a false positive at about
+    error_rate once capacity hashes are in. Probes start at the low bits of the hash and
+    step by the high bits, so nothing is hashed again, and a miss usually stops at the
+    first or second probe.
+    """
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(capacity, 1)
+        size = max(64, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.probes = max(1, round(size / self.capacity * math.log(2)))
+        self.mask = (1 << size.bit_length()) - 1  # size rounded up to a power of two, in bits
+        self.bits = bytearray((self.mask + 1) // 8)
+        self.count = 0
+
+    def add(self, value):
+        bits = self.bits
+        mask = self.mask
+        position = value & mask
+        step = (value >> 32) | 1
+        for _ in range(self.probes):
+            bits[position >> 3] |= 1 << (position & 7)
+            position = (position + step) & mask
+        self.count += 1
+
+    def __contains__(self, value):
+        bits = self.bits
+        mask = self.mask
+        position = value & mask
+        step = (value >> 32) | 1
+        for _ in range(self.probes):
+            if not bits[position >> 3] >> (position & 7) & 1:
+                return False
+            position = (position + step) & mask
+        return True
+
+class ImportHashIndex:
+    """Content hashes of every imported rental line, for idempotent re-imports
+
+    Hashes are 64-bit blake2b digests of the customer, books, days and timestamp. Saved
+    hashes are kept as one sorted array (8 bytes each, binary search), hashes added since
+    the last save in a set, and a Bloom filter in front answers most misses without
+    touching either. The filter is saved with the hashes so loading does not rebuild it.
+    Between full saves, hashes can be appended to a journal next to the index
+    (<index>.log), which loading merges back in.
+    """
+    INDEX_HEADER = struct.Struct('<4sQQQ')  # magic, hash count, Bloom capacity, Bloom hash count
+    INDEX_MAGIC = b'IHX1'
+
+    def __init__(self):
+        self.saved = array('Q')  # sorted, as on disk
+        self.added = set()
+        self.bloom = BloomFilter(1 << 16)
+        self._unjournaled = []  # hashes added since the index or journal was last written
+
+    @staticmethod
+    def rental_hash(customer_id, books_and_days, timestamp):
+        key = [customer_id]
+        for book, days in books_and_days:
+            key.append(book.id)
+            key.append(str(days))
+        key.append(timestamp)
+        return int.from_bytes(hashlib.blake2b('|'.join(key).encode(), digest_size=8).digest(), 'little')
+
+    def __len__(self):
+        return len(self.saved) + len(self.added)
+
+    def __contains__(self, value):
+        if value not in self.bloom:
+            return False
+        if value in self.added:
+            return True
+        i = bisect_left(self.saved, value)
+        return i < len(self.saved) and self.saved[i] == value
+
+    def add(self, value):
+        self._add(value)
+        self._unjournaled.append(value)
+
+    def _add(self, value):
+        self.added.add(value)
+        self.bloom.add(value)
+        if self.bloom.count > self.bloom.capacity:
+            self._rebuild_bloom()
+
+    def _rebuild_bloom(self):
+        #Size the filter for twice the current hashes so it is rebuilt O(log n) times
+        self.bloom = BloomFilter(2 * len(self))
+        for value in self.saved:
+            self.bloom.add(value)
+        for value in self.added:
+            self.bloom.add(value)
+
+    def read(self, filename):
+        with open(filename, 'rb') as file:
+            magic, count, capacity, bloom_count = self.INDEX_HEADER.unpack(file.read(self.INDEX_HEADER.size))
+            if magic != self.INDEX_MAGIC:
+                raise ValueError(f"{filename} is not an import hash index")
+            bloom = BloomFilter(capacity)
+            bloom.bits = bytearray(file.read(len(bloom.bits)))
+            bloom.count = bloom_count
+            saved = array('Q')
+            saved.fromfile(file, count)
+        self.saved = saved
+        self.added = set()
+        self.bloom = bloom
+
+    def read_journal(self, filename):
+        """Merge hashes journaled since the index was written; returns how many were read"""
+        try:
+            with open(filename + '.log', 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return 0
+        values = array('Q')
+        # A crash mid-append may leave a partial hash at the end
+        values.frombytes(data[:len(data) - len(data) % values.itemsize])
+        for value in values:
+            self._add(value)
+        return len(values)
+
+    def append_journal(self, filename):
+        """Append hashes added since the last write to the journal, without rewriting the index"""
+        if not self._unjournaled:
+            return []
+        with RecordWriter(filename + '.log', append=True, binary=True) as writer:
+            writer.write_bytes(array('Q', self._unjournaled).tobytes())
+        self._unjournaled = []
+        return [writer]
+
+    def save(self, filename):
+        self.saved = array('Q', heapq.merge(self.saved, sorted(self.added)))
+        self.added = set()
+        with RecordWriter(filename, binary=True) as writer:
+            writer.write_bytes(self.INDEX_HEADER.pack(self.INDEX_MAGIC, len(self.saved), self.bloom.capacity,
+                                                      self.bloom.count))
+            writer.write_bytes(self.bloom.bits)
+            writer.write_bytes(self.saved.tobytes())
+        # The index now holds every journaled hash
+        self._unjournaled = []
+        if os.path.exists(filename + '.log'):
+            os.remove(filename + '.log')
+        return [writer]
+
+class IdAllocator:
+    """Collision-free IDs of the form <prefix><number>, e.g. M011
+
+    Every ID in use is kept in a set, and numbers are handed out above a high-water mark
+    that is saved, so IDs of removed customers are never reused. A lock makes allocation
+    safe when several registrations run at once.
+    """
+    def __init__(self, prefix='M', width=3):
+        self.prefix = prefix
+        self.width = width
+        self.issued = set()
+        self.pending = set()  # allocated but not yet registered to a customer
+        self.high_water = 0  # highest number handed out or seen
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        #Locks cannot be pickled, e.g. when ShardedRecords returns shards from worker processes
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _number(self, item_id):
+        digits = item_id[len(self.prefix):]
+        if item_id.startswith(self.prefix) and digits.isdigit():
+            return int(digits)
+        return None
+
+    def register(self, item_id):
+        """Record an ID as in use; returns False if it is taken by someone else"""
+        with self._lock:
+            if item_id in self.pending:
+                self.pending.discard(item_id)
+                return True
+            if item_id in self.issued:
+                return False
+            self.issued.add(item_id)
+            number = self._number(item_id)
+            if number is not None and number > self.high_water:
+                self.high_water = number
+            return True
+
+    def release(self, item_id):
+        """Mark an ID as free; the high-water mark keeps it from being allocated again"""
+        with self._lock:
+            self.issued.discard(item_id)
+            self.pending.discard(item_id)
+
+    def __contains__(self, item_id):
+        return item_id in self.issued
+
+    def _next(self):
+        #Caller holds the lock; skips numbers already taken by IDs read from file
+        while True:
+            self.high_water += 1
+            item_id = f"{self.prefix}{self.high_water:0{self.width}d}"
+            if item_id not in self.issued:
+                self.issued.add(item_id)
+                self.pending.add(item_id)
+                return item_id
+
+    def allocate(self):
+        with self._lock:
+            return self._next()
+
+    def allocate_range(self, count):
+        """Allocate count IDs in one step, e.g. for a batch import"""
+        with self._lock:
+            return [self._next() for _ in range(count)]
+
+    def save(self, filename):
+        with RecordWriter(filename) as writer:
+            writer.write_line(f"{self.prefix}, {self.high_water}")
+        return [writer]
+
+    def read(self, filename):
+        with open_data_file(filename) as file:
+            for line in file:
+                parts = [part.strip() for part in line.split(',')]
+                if len(parts) == 2 and parts[0] == self.prefix and parts[1].isdigit():
+                    with self._lock:
+                        self.high_water = max(self.high_water, int(parts[1]))
+
+ImportCheckpoint = namedtuple('ImportCheckpoint', ['filename', 'offset', 'line_no', 'finished'], defaults=[False])
+
 class Records:
     """Central data repository with HD level features"""
-    def __init__(self):
+    CHECKPOINT_LINES = 50000  # import lines between progress commits
+    FOLLOW_READ_SIZE = 1 << 20  # most bytes read per poll when following a file
+
+    def __init__(self, read_only=False):
+        self.read_only = read_only
         self.customers = []
         self.book_categories = []
         self.books = []
         self.rentals = []
         self._customer_rentals = defaultdict(list)  # Track rentals by customer
-
+        self._rental_index = None  # RentalFileIndex in read-only mode
+        self._dirty = set()  # collections changed since the last load or save
+        self._saved_rental_count = 0  # rentals already in the rental file
+        self.rollups = RevenueRollup()
+        self.inventory = Inventory()
+        self.reservations = Reservations(self.inventory)
+        self.customer_ids = IdAllocator('M')
+        # Tier-wide discount rate histories, shared by the members of each tier in these records
+        self.tier_discount_rates = {policy.customer_type: RateHistory(policy.customer_class.DEFAULT_DISCOUNT_RATE)
+                                    for policy in TierPolicy.all() if policy.discount}
+        self.import_hashes = ImportHashIndex()
+        self._import_checkpoint = None  # ImportCheckpoint of the latest import, saved with the data
+        self._partitions = None  # month -> partition file, when rentals are stored per month
+        self._loaded_partitions = set()
+        self._dirty_partitions = set()  # months whose partition file must be rewritten
+        self.symbols = SymbolTable()  # IDs and names shared by the catalogue and the rental index
+        self._basket_items = {}  # one shared (book, days) tuple per distinct pair
+        self._item_labels = {}  # (book, days) -> "name: N days" for histories
+        self.co_rentals = CoRentalIndex()
 
     def read_customers(self, filename):
         """Read customer data from file"""
         try: #implement defensive programming stop using try catch
-            with open(filename, 'r') as file:
+            with open_data_file(filename) as file:
                 for line in file:
                     parts = [part.strip() for part in line.split(',')]
                     if len(parts) < 3:
                         continue
 
                     customer_type = parts[0]
-                    customer_id = parts[1]
-                    name = parts[2]
+                    customer_id = self.symbols.canonical(parts[1])
+                    name = self.symbols.canonical(parts[2])
 
+                    policy = TierPolicy.for_type(customer_type)
+                    if policy is None:
+                        continue
                     try:
-                        #switch case
-                        if customer_type == 'C':
-                            self.customers.append(Customer(customer_id, name))
-                        elif customer_type == 'M':
-                            discount_rate = float(parts[3]) if parts[3] != 'na' else None
-                            self.customers.append(Member(customer_id, name, discount_rate))
-                        elif customer_type == 'G':
-                            discount_rate = float(parts[3]) if parts[3] != 'na' else None
-                            reward_rate = float(parts[4]) if parts[4] != 'na' else 1.0
-                            reward_points = int(parts[5]) if parts[5] != 'na' else 0
-                            self.customers.append(GoldMember(customer_id, name, discount_rate, reward_rate, reward_points))
-                    except (ValueError, InvalidNameError) as e:
+                        self.customers.append(self._join_tier(policy.parse_customer(customer_id, name, parts[3:6])))
+                        self.customer_ids.register(customer_id)
+                    except (ValueError, IndexError, InvalidNameError) as e:
                         print(f"Error processing customer line: {line.strip()}. Error: {e}")
         except FileNotFoundError:
             raise FileNotFoundError(f"Customer file {filename} not found")
@@ -297,14 +2133,14 @@ class Records:
         """Read book and category data from files"""
         # update book series implementation
         try:
-            with open(books_file, 'r') as file:
+            with open_data_file(books_file) as file:
                 for line in file:
                     parts = [part.strip() for part in line.split(',')]
                     # Skip lines without at least ID and name
                     if len(parts) < 2:
                         continue
 
-                    book_id, book_name = parts[0], parts[1]
+                    book_id, book_name = self.symbols.canonical(parts[0]), self.symbols.canonical(parts[1])
 
                     # Handle Book Series (ID starts with 'S')
                     if book_id.startswith('S'):
@@ -313,17 +2149,25 @@ class Records:
                         # Create Book objects for all components
                         for name in parts[1:]:
                             book = self.find_book(name)
-                            component_books.append(book)
+                            # Skip names that are not existing books, e.g. a leading series title
+                            if book:
+                                component_books.append(book)
                         if component_books:
                             self.books.append(BookSeries(book_id, component_books))
                     else:
-                        self.books.append(Book(book_id, book_name))
+                        # Optional third field is the number of copies owned
+                        copies = 1
+                        if len(parts) > 2 and parts[2].isdigit():
+                            copies = int(parts[2])
+                        book = Book(book_id, book_name, copies=copies)
+                        self.books.append(book)
+                        self.inventory.add_book(book)
         except FileNotFoundError:
             raise FileNotFoundError(f"Book file {books_file} not found")
 
         # Then read categories and assign books to them
         try:
-            with open(categories_file, 'r') as file:
+            with open_data_file(categories_file) as file:
                 for line in file:
                     parts = [part.strip() for part in line.split(',')]
                     if len(parts) >= 5:
@@ -332,17 +2176,27 @@ class Records:
                         # Check if type is specified
                         if parts[2] in ['Rental', 'Reference']:
                             category_type = parts[2]
-                            price_1 = float(parts[3])
-                            price_2 = float(parts[4])
+                            price_fields = parts[3:5]
                             book_names = parts[5:]
                         else:
                             category_type = "Rental"
-                            price_1 = float(parts[2])
-                            price_2 = float(parts[3])
+                            price_fields = parts[2:4]
                             book_names = parts[4:]
 
                         try:
-                            category = BookCategory(category_id, category_name, price_1, price_2, category_type)
+                            price_1 = float(price_fields[0])
+                            price_2 = float(price_fields[1])
+                            # Optional key=value fields before the books: tiers, cap and series rate
+                            options = {}
+                            while book_names and '=' in book_names[0]:
+                                key, _, value = book_names.pop(0).partition('=')
+                                options[key.strip()] = value.strip()
+                            cap = float(options['cap']) if 'cap' in options else None
+                            tiers = PriceSchedule.parse(options['tiers']).tiers if 'tiers' in options else None
+                            series_rate = float(options.get('series', 0.5))
+
+                            category = BookCategory(category_id, category_name, price_1, price_2, category_type,
+                                                    tiers, cap, series_rate)
                             self.book_categories.append(category)
 
                             for book_name in book_names:
@@ -355,44 +2209,372 @@ class Records:
             raise FileNotFoundError(f"Category file {categories_file} not found")
 
     def read_rentals(self, rental_file):
+        load_time = datetime.now()
         try:
-            with open(rental_file, 'r') as file:
+            self._load_rental_file(rental_file, load_time)
+        except FileNotFoundError:
+            print(f"Rental file '{rental_file}' not found.")
+
+        self.replay_reward_ledgers()
+        # Everything loaded so far is already on disk
+        self._saved_rental_count = len(self.rentals)
+        self._dirty.discard('rentals')
+        self._dirty.discard('loans')
+
+    def _load_rental_file(self, rental_file, loans_as_of, update_rollups=True):
+        with open_data_file(rental_file) as file:
+            for line in file:
+                parts = [part.strip() for part in line.split(',')]
+                if len(parts) < 7:
+                    continue
+
+                customer_id = parts[0]
+                customer = self.find_customer(customer_id)
+                if not customer:
+                    continue
+
+                books_and_days = []
+                i = 1
+                while i < len(parts) - 6:
+                    book_id = parts[i]
+                    days_str = parts[i+1]
+
+                    book = self.find_book(book_id)
+                    if book:
+                        try:
+                            days = int(days_str)
+                            books_and_days.append(self._basket_item(book, days))
+                        except ValueError:
+                            pass
+                    i += 2
+
+                try:
+                    timestamp = datetime.strptime(parts[-1], '%d/%m/%Y %H:%M:%S')
+                except ValueError:
+                    timestamp = datetime.now()
+
+                rental = Rental(customer, books_and_days, timestamp, apply_rewards=False,
+                                points_redeemed=self._saved_points_redeemed(customer, parts),
+                                quote=self._saved_quote(parts))
+                self.add_rental(rental, loans_as_of=loans_as_of, update_rollups=update_rollups)
+
+    @staticmethod
+    def _saved_quote(parts):
+        #Costs stored with a rental line; None if they cannot be read, so the rental is priced again
+        try:
+            reward = int(parts[-2]) if parts[-2] != 'na' else 0
+            return RentalQuote(to_cents(parts[-5]), to_cents(parts[-4]), reward, to_cents(parts[-3]))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _saved_points_redeemed(customer, parts):
+        #Points redeemed by a stored rental, from what its cost columns do not explain
+        if not TierPolicy.for_customer(customer).rewards:
+            return 0
+        try:
+            redeemed = to_cents(parts[-5]) - to_cents(parts[-4]) - to_cents(parts[-3])
+        except ValueError:
+            return 0
+        return max(redeemed, 0) // CENTS_PER_AUD * 20
+
+    @staticmethod
+    def partition_key(timestamp):
+        return timestamp.strftime('%Y-%m')
+
+    def read_rental_partitions(self, directory, recent_months=3, rollup_file=None):
+        """Load rentals stored as one file per month (YYYY-MM.txt, optionally compressed)
+
+        Only the latest recent_months partitions are read now; older ones are read on
+        demand by load_partitions() and date-range queries. Totals for the unread months
+        come from the saved rollups, so without a rollup file every partition is read.
+        """
+        self._partitions = {}
+        self._loaded_partitions = set()
+        for name in os.listdir(directory):
+            month = name.split('.')[0]
+            if name[len(month):] not in ('.txt', '.txt.gz', '.txt.bz2', '.txt.xz'):
+                continue
+            try:
+                datetime.strptime(month, '%Y-%m')
+            except ValueError:
+                continue
+            self._partitions[month] = os.path.join(directory, name)
+
+        if rollup_file is None:
+            rollup_file = self.sidecar_file(directory, "rollups.txt")
+        months = sorted(self._partitions)
+        try:
+            self.rollups.read(rollup_file)
+            # Rollups already count every partition, loaded or not
+            self._load_partitions(months[-recent_months:] if recent_months > 0 else [], datetime.now(),
+                                  update_rollups=False)
+        except FileNotFoundError:
+            self._load_partitions(months, datetime.now())
+
+    def _load_partitions(self, months, loans_as_of, update_rollups=True):
+        months = sorted(month for month in months if month in self._partitions and month not in self._loaded_partitions)
+        if not months:
+            return
+        dirty = set(self._dirty)
+        dirty_partitions = set(self._dirty_partitions)
+        for month in months:
+            self._load_rental_file(self._partitions[month], loans_as_of, update_rollups)
+            self._loaded_partitions.add(month)
+        # Older months may arrive after newer ones; keep history in time order
+        self.rentals.sort(key=lambda rental: rental.timestamp)
+        for rentals in self._customer_rentals.values():
+            rentals.sort(key=lambda rental: rental.timestamp)
+        self.replay_reward_ledgers()
+        # Everything just loaded is already on disk
+        self._dirty = dirty
+        self._dirty_partitions = dirty_partitions
+
+    def load_partitions(self, start=None, end=None):
+        """Make sure every rental from start to end (datetimes, either open) is in memory"""
+        if self._partitions is None:
+            return
+        first = self.partition_key(start) if start else ''
+        last = self.partition_key(end) if end else '9999-12'
+        # Loans and rollups of unread months were restored from their own files
+        self._load_partitions([month for month in self._partitions if first <= month <= last], datetime.max,
+                              update_rollups=False)
+
+    @staticmethod
+    def _in_range(timestamp, start, end):
+        if timestamp is None:
+            return start is None and end is None
+        return (start is None or timestamp >= start) and (end is None or timestamp <= end)
+
+    def rentals_between(self, start=None, end=None):
+        """Rentals from start to end, reading only the partitions that cover the range"""
+        self.load_partitions(start, end)
+        return [rental for rental in self.rentals if self._in_range(rental.timestamp, start, end)]
+
+    def replay_reward_ledgers(self):
+        """Rebuild every Gold member's ledger from the rentals held in memory
+
+        The saved balance is kept as the current balance; whatever the loaded rentals do
+        not explain (including redemptions before the last save) becomes the opening entry.
+        """
+        for customer in self.customers:
+            if not TierPolicy.for_customer(customer).rewards:
+                continue
+            entries = []
+            for rental in self._customer_rentals.get(customer.id, []):
+                timestamp = rental.timestamp.timestamp()
+                if rental.points_redeemed:
+                    entries.append((timestamp, RewardLedger.REDEEM, -rental.points_redeemed))
+                if rental.reward:
+                    entries.append((timestamp, RewardLedger.EARN, rental.reward))
+            opening = customer.reward_points - sum(entry[2] for entry in entries)
+            if opening:
+                entries.insert(0, (0.0, RewardLedger.ADJUST, opening))
+            customer.ledger.replay(entries)
+
+    def mark_dirty(self, *collections):
+        """Flag 'customers', 'books', 'categories', 'rentals', 'rates' etc. for the next save"""
+        self._dirty.update(collections)
+
+    def is_dirty(self, collection):
+        return collection in self._dirty
+
+    def add_customer(self, customer):
+        if not self.customer_ids.register(customer.id):
+            raise ValueError(f"Customer ID {customer.id} is already in use")
+        self.customers.append(self._join_tier(customer))
+        self.mark_dirty('customers', 'ids')
+
+    def _join_tier(self, customer):
+        #Point a member at the tier rate history of these records
+        history = self.tier_discount_rates.get(customer.customer_type)
+        if history is not None:
+            customer.tier_discount_rates = history
+        return customer
+
+    def set_tier_discount_rate(self, customer_type, new_rate, effective=None):
+        """Change the discount rate of a whole tier from effective (default now)"""
+        if not 0 < new_rate < 1:
+            raise ValueError("Discount rate must be between 0 and 1")
+        self.tier_discount_rates[customer_type].set(new_rate, effective)
+        self.mark_dirty('rates')
+
+    def allocate_customer_ids(self, count=1):
+        """Reserve IDs for new members; a single ID when count is 1"""
+        ids = self.customer_ids.allocate_range(count)
+        self.mark_dirty('ids')
+        return ids[0] if count == 1 else ids
+
+    def read_customer_ids(self, id_file):
+        """Load the saved high-water mark so IDs of removed customers stay retired"""
+        try:
+            self.customer_ids.read(id_file)
+        except FileNotFoundError:
+            return
+        self._dirty.discard('ids')
+
+    def remove_customer(self, customer):
+        if customer in self.customers:
+            self.customers.remove(customer)
+            # The ID may be registered again, e.g. when a customer is replaced in place
+            self.customer_ids.release(customer.id)
+            self.mark_dirty('customers')
+
+    def read_loans(self, loan_file):
+        """Replace loans rebuilt from rental history with the saved active loans"""
+        try:
+            with open_data_file(loan_file) as file:
+                self.inventory.clear_loans()
                 for line in file:
                     parts = [part.strip() for part in line.split(',')]
-                    if len(parts) < 7:
+                    if len(parts) != 3:
                         continue
-
-                    customer_id = parts[0]
-                    customer = self.find_customer(customer_id)
-                    if not customer:
+                    book = self.find_book(parts[1])
+                    try:
+                        due = datetime.strptime(parts[2], '%d/%m/%Y %H:%M:%S')
+                    except ValueError:
+                        print(f"Error processing loan line: {line.strip()}")
                         continue
+                    if book:
+                        self.inventory.checkout(parts[0], book, 0, due, strict=False)
+        except FileNotFoundError:
+            return
+        self._dirty.discard('loans')
+
+    def return_book(self, customer_id, book):
+        """Return a customer's copy of book; returns (closed loan, customer the copy is now held for)"""
+        returned = []
+        for loan in self.inventory.return_book(customer_id, book):
+            returned.append((loan, self.reservations.hand_off(loan.book_id)))
+        if returned:
+            self.mark_dirty('loans', 'reservations')
+        return returned
+
+    def reserve_book(self, book, customer):
+        queued = self.reservations.reserve(book, customer)
+        if queued:
+            self.mark_dirty('reservations')
+        return queued
+
+    def read_reservations(self, reservation_file):
+        """Load waiting lists ('R' lines) and copies held for customers ('H' lines)"""
+        try:
+            with open_data_file(reservation_file) as file:
+                for line in file:
+                    parts = [part.strip() for part in line.split(',')]
+                    if len(parts) < 3:
+                        continue
+                    customer = self.find_customer(parts[2])
+                    if not customer or not self.find_book(parts[1]):
+                        print(f"Error processing reservation line: {line.strip()}")
+                        continue
+                    if parts[0] == 'H':
+                        self.inventory.hold(parts[1], customer.id)
+                    elif parts[0] == 'R' and len(parts) == 4 and parts[3].isdigit():
+                        self.reservations.restore(parts[1], customer, int(parts[3]))
+        except FileNotFoundError:
+            return
+        self._dirty.discard('reservations')
 
-                    books_and_days = []
-                    i = 1
-                    while i < len(parts) - 6:
-                        book_id = parts[i]
-                        days_str = parts[i+1]
-
-                        book = self.find_book(book_id)
-                        if book:
-                            try:
-                                days = int(days_str)
-                                books_and_days.append((book, days))
-                            except ValueError:
-                                pass
-                        i += 2
+    def read_rates(self, rate_file):
+        """Load effective-dated rates: 'T' lines for a tier, 'C' lines for one customer
 
+        Must run before rentals are read, since loaded rentals are priced at their own time.
+        """
+        histories = defaultdict(list)
+        try:
+            with open_data_file(rate_file) as file:
+                for line in file:
+                    parts = [part.strip() for part in line.split(',')]
+                    if len(parts) != 5:
+                        continue
                     try:
-                        timestamp = datetime.strptime(parts[-1], '%d/%m/%Y %H:%M:%S')
+                        rate = float(parts[3])
+                        start = (float('-inf') if parts[4] == 'na'
+                                 else datetime.strptime(parts[4], '%d/%m/%Y %H:%M:%S').timestamp())
                     except ValueError:
-                        timestamp = datetime.now()
+                        print(f"Error processing rate line: {line.strip()}")
+                        continue
+                    histories[(parts[0], parts[1], parts[2])].append((start, rate))
+        except FileNotFoundError:
+            return
 
-                    rental = Rental(customer, books_and_days, timestamp)
-                    self.add_rental(rental)
+        for (scope, key, kind), entries in histories.items():
+            if scope == 'T':
+                if key in self.tier_discount_rates and kind == 'discount':
+                    self.tier_discount_rates[key].replay(entries)
+                continue
+            customer = self.find_customer(key)
+            if not customer:
+                continue
+            policy = TierPolicy.for_customer(customer)
+            if kind == 'discount' and policy.discount:
+                customer.own_discount_rates = RateHistory()
+                customer.own_discount_rates.replay(entries)
+            elif kind == 'reward' and policy.rewards:
+                customer.reward_rates.replay(entries)
+        self._dirty.discard('rates')
+
+    def reprice_rentals(self, rentals=None):
+        """Quote past rentals (default all) again at the rates in effect when each was made
+
+        Returns (rental, quote) pairs; the rentals themselves are not changed.
+        """
+        pricer = RentalPricer()
+        if rentals is None:
+            self.load_partitions()
+            rentals = self.rentals
+        return [(rental, pricer.reprice(rental)) for rental in rentals]
+
+    def read_rollups(self, rollup_file):
+        """Load saved rollups, for when rentals themselves are not loaded"""
+        try:
+            self.rollups.read(rollup_file)
+        except FileNotFoundError:
+            print(f"Rollup file '{rollup_file}' not found.")
 
+    def open_rental_index(self, rental_file):
+        """Memory-map the rental file instead of loading it (read-only mode)"""
+        if os.path.isdir(rental_file):
+            print(f"Rentals in '{rental_file}' are partitioned by month; read-only mode shows the saved rollups only.")
+            return
+        if detect_compression(rental_file):
+            print(f"Compressed rental file '{rental_file}' cannot be memory-mapped; decompress it for read-only mode.")
+            return
+        try:
+            self._rental_index = RentalFileIndex(rental_file, self.symbols)
         except FileNotFoundError:
             print(f"Rental file '{rental_file}' not found.")
 
+    def _summarise_rental_row(self, parts):
+        #Turn the fields of a stored rental line into a history entry without building a Rental
+        books_info = []
+        for i in range(1, len(parts) - 6, 2):
+            book = self.find_book(parts[i])
+            name = book.name if isinstance(book, Book) else parts[i]
+            books_info.append(f"{name}: {parts[i+1]} days")
+        try:
+            timestamp = datetime.strptime(parts[-1], '%d/%m/%Y %H:%M:%S')
+        except ValueError:
+            timestamp = None
+        return {
+            'customer_id': parts[0],
+            'books_info': ", ".join(books_info),
+            'original_cost': to_cents(parts[-5]),
+            'discount': to_cents(parts[-4]),
+            'total_cost': to_cents(parts[-3]),
+            'reward': parts[-2],
+            'timestamp': timestamp
+        }
+
+    def iter_rental_rows(self):
+        """Yield a summary dict for every indexed rental line (read-only mode)"""
+        for parts in self._rental_index.rows():
+            try:
+                yield self._summarise_rental_row(parts)
+            except ValueError:
+                continue
+
     def find_customer(self, search_value):
         #Find customer by ID or name
         for customer in self.customers:
@@ -416,116 +2598,318 @@ class Records:
         return None
 
 
-    def list_customers(self):
+    def list_customers(self, output=None):
         """Display all customers"""
-        print("\nList of Customers:")
-        for customer in self.customers:
-            customer.display_info()
-        print()
+        output = output or PagedOutput()
+        output.render("\nList of Customers:\n",
+                      (f"{customer.describe()}\n" for customer in self.customers))
 
-    def list_books(self):
+    def list_books(self, output=None):
         """Display all books"""
-        print("\nList of Books:")
-        for book in self.books:
-            book.display_info()
-        print()
+        output = output or PagedOutput()
+        output.render("\nList of Books:\n",
+                      (f"{book.describe()}\n" for book in self.books))
         """Display all book series"""
-        print("\nList of Book Series:")
-        for book in self.books:
-            if isinstance(book, BookSeries):
-                book.display_info()
-        print()
+        output.render("\nList of Book Series:\n",
+                      (f"{book.describe()}\n" for book in self.books if isinstance(book, BookSeries)))
 
-    def list_book_categories(self):
+    def list_book_categories(self, output=None):
         """Display all book categories"""
-        print("\nList of Book Categories:")
-        for category in self.book_categories:
-            category.display_info()
-        print()
-
-    def add_rental(self, rental):
-        """Add a new rental to records"""
+        output = output or PagedOutput()
+        output.render("\nList of Book Categories:\n",
+                      (f"{category.describe()}\n" for category in self.book_categories))
+
+    def add_rental(self, rental, loans_as_of=None, update_rollups=True, strict=False):
+        """Add a new rental to records
+
+        loans_as_of is used when replaying history: items due by then are not put on loan.
+        With strict, a rental needing more copies than are on the shelf raises
+        BookUnavailableError before anything is recorded.
+        """
+        if self.read_only:
+            raise ReadOnlyRecordsError("Records were opened in read-only mode")
+        if strict and not self.inventory.can_checkout(rental.books_and_days, rental.customer.id):
+            raise BookUnavailableError("Not enough copies are available for this rental")
         self.rentals.append(rental)
         self._customer_rentals[rental.customer.id].append(rental)
-        self.rentals_modified = True
-
-    def process_rental_file(self, filename):
-
+        if update_rollups:
+            self.rollups.add_rental(rental)
+        self.co_rentals.add_rental(rental)
+        self.inventory.checkout_rental(rental, loans_as_of)
+        self.mark_dirty('rentals', 'loans')
+        if self._partitions is not None:
+            self._dirty_partitions.add(self.partition_key(rental.timestamp))
+        if rental.apply_rewards and TierPolicy.for_customer(rental.customer).rewards:
+            self.mark_dirty('customers')
+
+    def _basket_item(self, book, days):
+        #Rentals loaded from millions of lines share one tuple per (book, days)
+        item = (book, days)
+        return self._basket_items.setdefault(item, item)
+
+    def _item_label(self, item):
+        label = self._item_labels.get(item)
+        if label is None:
+            book, days = item
+            label = self._item_labels[item] = f"{book.name}: {days} days"
+        return label
+
+    def similar_books(self, book, n=5, exclude=()):
+        """Books most often co-rented with book, as (book, customers) pairs; see CoRentalIndex"""
+        # The index only counts rentals in memory, so every partition must be read
+        self.load_partitions()
+        return self.co_rentals.similar(book, n, exclude)
+
+    def memory_report(self):
+        """Return (structure, bytes now, bytes without shared storage) rows
+
+        The second figure is what the same data took with a separate string or tuple per
+        rental line, as before interning.
+        """
+        tuple_size = sys.getsizeof((None, 0))
+        items = sum(len(rental.books_and_days) for rental in self.rentals)
+        rows = [("Rental basket items", len(self._basket_items) * tuple_size, items * tuple_size),
+                ("Symbol table", self.symbols.memory_size(), 0)]
+        index = self._rental_index
+        if index:
+            # A str per line plus its list slot, and a boxed int per line in the per-customer lists
+            unshared = sum(sys.getsizeof(index.customer_id(line_no)) + 8 + sys.getsizeof(line_no) + 8
+                           for line_no in range(len(index)))
+            rows.append(("Rental index customer IDs", index.memory_size(), unshared))
+        return rows
+
+    def read_import_hashes(self, hash_file):
         try:
-            with open(filename, 'r') as file:
-                for line in file:
-                    parts = [part.strip() for part in line.split(',')]
-                    if len(parts) < 7:  # Minimum valid line
-                        continue
-
-                    # Parse customer
-                    customer_input = parts[0]
-                    customer = self.find_customer(customer_input)
-                    if not customer:
-                        print(f"Customer {customer_input} not found in line: {line}")
-                        continue
+            self.import_hashes.read(hash_file)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, EOFError, struct.error) as e:
+            print(f"Could not load import hash index {hash_file}: {e}")
+            return
+        # Hashes committed by an import since the last full save go into the next one
+        if self.import_hashes.read_journal(hash_file):
+            self.mark_dirty('imports')
+        else:
+            self._dirty.discard('imports')
 
-                    # Parse books and days (alternating pattern)
-                    books_and_days = []
-                    i = 1
-                    while i < len(parts) - 6:  # Last 6 parts are cost info and timestamp
-                        book_input = parts[i]
-                        days_str = parts[i+1] if i+1 < len(parts) else '0'
+    def read_import_checkpoint(self, filename):
+        """Return where an interrupted import of filename stopped, or None"""
+        try:
+            with open(filename + '.ckpt', 'r') as file:
+                parts = [part.strip() for part in file.readline().split(',')]
+            offset, line_no = int(parts[0]), int(parts[1])
+        except (FileNotFoundError, ValueError, IndexError):
+            return None
+        try:
+            if detect_compression(filename) is None and offset > os.path.getsize(filename):
+                return None  # the file was replaced or truncated since
+        except OSError:
+            return None
+        return ImportCheckpoint(filename, offset, line_no)
+
+    def save_import_checkpoint(self):
+        """Write how far the current import got; only called once its rentals are saved"""
+        checkpoint = self._import_checkpoint
+        checkpoint_file = checkpoint.filename + '.ckpt'
+        if checkpoint.finished:
+            # Finished imports leave nothing to resume
+            self._import_checkpoint = None
+            if os.path.exists(checkpoint_file):
+                os.remove(checkpoint_file)
+            return []
+        with RecordWriter(checkpoint_file) as writer:
+            writer.write_line(f"{checkpoint.offset}, {checkpoint.line_no}")
+        return [writer]
+
+    def _import_rental_line(self, line):
+        """Import one rental file line; True if imported, False if already imported, None if invalid"""
+        parts = [part.strip() for part in line.split(',')]
+        if len(parts) < 7:  # Minimum valid line
+            return None
 
-                        book = self.find_book(book_input)
-                        if not book:
-                            print(f"Book {book_input} not found in line: {line}")
-                            break
+        # Parse customer
+        customer_input = parts[0]
+        customer = self.find_customer(customer_input)
+        if not customer:
+            print(f"Customer {customer_input} not found in line: {line}")
+            return None
 
-                        try:
-                            days = int(days_str)
-                            if days <= 0:
-                                raise ValueError
-                            # Check reference book limit
-                            if book.category and book.category.type == "Reference" and days > 14:
-                                raise ReferenceBookLimitError("Reference books cannot be borrowed for more than 14 days")
-                        except ValueError:
-                            print(f"Invalid days {days_str} in line: {line}")
-                            break
-                        except ReferenceBookLimitError as e:
-                            print(f"{e} in line: {line}")
-                            break
+        # Parse books and days (alternating pattern)
+        books_and_days = []
+        i = 1
+        while i < len(parts) - 6:  # Last 6 parts are cost info and timestamp
+            book_input = parts[i]
+            days_str = parts[i+1] if i+1 < len(parts) else '0'
+
+            book = self.find_book(book_input)
+            if not book:
+                print(f"Book {book_input} not found in line: {line}")
+                break
 
-                        books_and_days.append((book, days))
-                        i += 2
+            try:
+                days = int(days_str)
+                if days <= 0:
+                    raise ValueError
+                # Check reference book limit
+                if isinstance(book, Book) and book.category and book.category.type == "Reference" and days > 14:
+                    raise ReferenceBookLimitError("Reference books cannot be borrowed for more than 14 days")
+            except ValueError:
+                print(f"Invalid days {days_str} in line: {line}")
+                break
+            except ReferenceBookLimitError as e:
+                print(f"{e} in line: {line}")
+                break
 
-                    if not books_and_days:
-                        continue
+            books_and_days.append(self._basket_item(book, days))
+            i += 2
 
-                    # Parse timestamp
-                    try:
-                        timestamp = datetime.strptime(parts[-1], '%d/%m/%Y %H:%M:%S')
-                    except ValueError:
-                        timestamp = datetime.now()
+        if not books_and_days:
+            return None
 
-                    # Create rental (skip cost info as we'll recalculate)
-                    rental = Rental(customer, books_and_days, timestamp)
-                    self.add_rental(rental)
+        # Same customer, books, days and timestamp means the line was imported before
+        content_hash = ImportHashIndex.rental_hash(customer.id, books_and_days, parts[-1])
+        if content_hash in self.import_hashes:
+            return False
 
-                    # For Gold members, update reward points from file if provided
-                    if isinstance(customer, GoldMember) and parts[-2] != 'na':
-                        try:
-                            reward = int(parts[-2])
-                            customer.update_reward(reward)
-                        except ValueError:
-                            pass
-
-            print(f"Successfully processed rentals from {filename}")
+        # Parse timestamp
+        try:
+            timestamp = datetime.strptime(parts[-1], '%d/%m/%Y %H:%M:%S')
+        except ValueError:
+            timestamp = datetime.now()
+
+        # Create rental (skip cost info as we'll recalculate)
+        # The Rental earns its own reward, so the file's reward column is not added again
+        rental = Rental(customer, books_and_days, timestamp)
+        self.add_rental(rental)
+        self.import_hashes.add(content_hash)
+        self.mark_dirty('imports')
+        return True
+
+    def process_rental_file(self, filename, resume=False, commit=None):
+        """Import rentals from a file, skipping lines that were already imported
+
+        The byte offset and line number reached are saved with the data as
+        <filename>.ckpt, so resume=True seeks straight past lines already imported.
+        commit, if given, is called every CHECKPOINT_LINES lines to save progress.
+        """
+        imported = skipped = 0
+        checkpoint = self.read_import_checkpoint(filename) if resume else None
+        offset, line_no = (checkpoint.offset, checkpoint.line_no) if checkpoint else (0, 0)
+        try:
+            # Binary mode so the offset of every line (in the decompressed data) is known
+            with open_data_file(filename, 'rb') as file:
+                file.seek(offset)
+                if checkpoint:
+                    print(f"Resuming {filename} after line {line_no}")
+                for raw_line in file:
+                    offset += len(raw_line)
+                    line_no += 1
+                    result = self._import_rental_line(raw_line.decode())
+                    if result:
+                        imported += 1
+                    elif result is False:
+                        skipped += 1
+                    self._import_checkpoint = ImportCheckpoint(filename, offset, line_no)
+                    if commit and line_no % self.CHECKPOINT_LINES == 0:
+                        commit()
         except FileNotFoundError:
             print(f"Cannot find the rental file {filename}")
+            return
 
-    def get_most_valuable_customer(self):
-        """Find customer who spent the most (HD level)"""
-        customer_spending = defaultdict(float)
+        self._import_checkpoint = ImportCheckpoint(filename, offset, line_no, finished=True)
+        print(f"Successfully processed rentals from {filename}: {imported} imported, "
+              f"{skipped} already imported")
+
+    def follow_rental_file(self, filename, poll_interval=0.2, batch_lines=1000, commit=None, on_batch=None,
+                           should_stop=None):
+        """Keep importing lines appended to filename until should_stop() is true or Ctrl-C
+
+        The file is polled with os.stat; only complete lines are read, in micro-batches of
+        up to batch_lines, and rollups and inventory are updated as each rental is added.
+        Following starts where the last import of the file stopped, if known. A truncated or replaced file is
+        read again from the top, where the import hash index skips lines already seen.
+        on_batch(imported, skipped) is called after every batch. Returns the rentals imported.
+        """
+        if detect_compression(filename):
+            print(f"Cannot follow compressed file {filename}; only plain files grow line by line.")
+            return 0
+        checkpoint = self._import_checkpoint
+        if not checkpoint or checkpoint.filename != filename:
+            checkpoint = self.read_import_checkpoint(filename)
+        offset, line_no = (checkpoint.offset, checkpoint.line_no) if checkpoint else (0, 0)
+        total = uncommitted = 0
+        file = None
+        inode = None
+        try:
+            while not (should_stop and should_stop()):
+                try:
+                    stat = os.stat(filename)
+                except FileNotFoundError:
+                    # Rotated away; wait for the new file
+                    time.sleep(poll_interval)
+                    continue
+                if file is not None and (stat.st_ino != inode or stat.st_size < offset):
+                    file.close()
+                    file = None
+                    offset = line_no = 0
+                if file is None:
+                    file = open(filename, 'rb')
+                    inode = stat.st_ino
+                    if stat.st_size < offset:
+                        offset = line_no = 0
+
+                data = b''
+                if stat.st_size > offset:
+                    file.seek(offset)
+                    data = file.read(min(stat.st_size - offset, self.FOLLOW_READ_SIZE))
+                    # A line still being written is left for the next poll
+                    data = data[:data.rfind(b'\n') + 1]
+                if not data:
+                    time.sleep(poll_interval)
+                    continue
 
-        for rental in self.rentals:
+                lines = data.splitlines(keepends=True)
+                for start in range(0, len(lines), batch_lines):
+                    imported = skipped = 0
+                    for raw_line in lines[start:start + batch_lines]:
+                        offset += len(raw_line)
+                        line_no += 1
+                        result = self._import_rental_line(raw_line.decode())
+                        if result:
+                            imported += 1
+                        elif result is False:
+                            skipped += 1
+                    self._import_checkpoint = ImportCheckpoint(filename, offset, line_no)
+                    total += imported
+                    uncommitted += imported
+                    if on_batch:
+                        on_batch(imported, skipped)
+                if commit and uncommitted >= self.CHECKPOINT_LINES:
+                    commit()
+                    uncommitted = 0
+        finally:
+            if file is not None:
+                file.close()
+        return total
+
+    def get_customer_spending(self, start=None, end=None):
+        """Total spending in cents per customer ID, optionally between start and end"""
+        customer_spending = defaultdict(int)
+
+        if self._rental_index:
+            for row in self.iter_rental_rows():
+                if self._in_range(row['timestamp'], start, end):
+                    customer_spending[row['customer_id']] += row['total_cost']
+            return customer_spending
+
+        for rental in self.rentals_between(start, end):
             customer_id = rental.customer.id
             customer_spending[customer_id] += rental.total_cost
+        return customer_spending
+
+    def get_most_valuable_customer(self, start=None, end=None):
+        """Find customer who spent the most (HD level)"""
+        customer_spending = self.get_customer_spending(start, end)
 
         if not customer_spending:
             return None
@@ -533,18 +2917,30 @@ class Records:
         max_id = max(customer_spending.items(), key=lambda x: x[1])[0]
         return self.find_customer(max_id)
 
-    def get_customer_rental_history(self, customer_id):
-        """Get rental history for a customer (HD level)"""
-        rentals = self._customer_rentals.get(customer_id, [])
+    def get_customer_rental_history(self, customer_id, start=None, end=None):
+        """Get rental history for a customer (HD level), optionally between start and end"""
+        if self._rental_index:
+            history = []
+            for parts in self._rental_index.rows(self._rental_index.customer_lines(customer_id)):
+                try:
+                    entry = self._summarise_rental_row(parts)
+                except ValueError:
+                    continue
+                if not self._in_range(entry['timestamp'], start, end):
+                    continue
+                entry['rental_num'] = len(history) + 1
+                history.append(entry)
+            return history or None
+
+        self.load_partitions(start, end)
+        rentals = [rental for rental in self._customer_rentals.get(customer_id, [])
+                   if self._in_range(rental.timestamp, start, end)]
         if not rentals:
             return None
 
         history = []
         for i, rental in enumerate(rentals, 1):
-            books_info = ", ".join(
-                f"{book.name}: {days} days"
-                for book, days in rental.books_and_days
-            )
+            books_info = ", ".join(self._item_label(item) for item in rental.books_and_days)
 
             history.append({
                 'rental_num': i,
@@ -552,61 +2948,294 @@ class Records:
                 'original_cost': rental.original_cost,
                 'discount': rental.discount,
                 'total_cost': rental.total_cost,
-                'reward': rental.reward if isinstance(rental.customer, GoldMember) else 'na',
+                'reward': rental.reward if TierPolicy.for_customer(rental.customer).rewards else 'na',
                 'timestamp': rental.timestamp
             })
 
         return history
 
+    def _format_customer(self, customer):
+        return TierPolicy.for_customer(customer).format_customer(customer)
+
+    def _format_rental(self, rental, writer):
+        customer = rental.customer
+        books_info = ', '.join(f"{book.id}, {days}" for book, days in rental.books_and_days)
+        timestamp = writer.format_timestamp(rental.timestamp)
+
+        reward = rental.reward if TierPolicy.for_customer(customer).rewards else 'na'
+        return f"{customer.id}, {books_info}, {format_cents(rental.original_cost)}, {format_cents(rental.discount)}, {format_cents(rental.total_cost)}, {reward}, {timestamp}"
+
+    def _format_book(self, book):
+        if isinstance(book, BookSeries):
+            book_names = [b.name for b in book.books]
+            return f"{book.id}, {', '.join(book_names)}"
+        if book.copies != 1:
+            return f"{book.id}, {book.name}, {book.copies}"
+        return f"{book.id}, {book.name}"
+
+    def _format_category(self, category):
+        book_names = [book.name for book in category.books]
+        options = ""
+        if not category.schedule.is_two_tier():
+            options += f"tiers={category.schedule.encode()}, "
+            if category.cap is not None:
+                options += f"cap={category.cap}, "
+        if category.series_rate != 0.5:
+            options += f"series={category.series_rate}, "
+        return f"{category.id}, {category.name}, {category.type}, {category.price_1}, {category.price_2}, {options}{', '.join(book_names)}"
+
     def save_customers(self, customer_file):
-        with open(customer_file, 'w') as file:
-            for customer in self.customers:
-                if isinstance(customer, GoldMember):
-                    file.write(f"G, {customer.id}, {customer.name}, {customer.discount_rate}, {customer.reward_rate}, {customer.reward_points}\n")
-                elif isinstance(customer, Member):
-                    file.write(f"M, {customer.id}, {customer.name}, {customer.discount_rate}, na, na\n")
-                else:
-                    file.write(f"C, {customer.id}, {customer.name}, na, na, na\n")
+        with RecordWriter(customer_file) as writer:
+            writer.write_lines(self._format_customer(customer) for customer in self.customers)
+        return [writer]
 
     def save_rentals(self, rental_file):
-        with open(rental_file, 'w') as file:
-            for rental in self.rentals:
-                customer = rental.customer
-                books_info = []
-                for book, days in rental.books_and_days:
-                    books_info.append(book.id)
-                    books_info.append(str(days))
-
-                if isinstance(customer, GoldMember):
-                    file.write(f"{customer.id}, {', '.join(books_info)}, {rental.original_cost:.2f}, {rental.discount:.2f}, {rental.total_cost:.2f}, {rental.reward}, {rental.timestamp.strftime('%d/%m/%Y %H:%M:%S')}\n")
-                elif isinstance(customer, Member):
-                    file.write(f"{customer.id}, {', '.join(books_info)}, {rental.original_cost:.2f}, {rental.discount:.2f}, {rental.total_cost:.2f}, na, {rental.timestamp.strftime('%d/%m/%Y %H:%M:%S')}\n")
-                else:
-                    file.write(f"{customer.id}, {', '.join(books_info)}, {rental.original_cost:.2f}, 0.00, {rental.total_cost:.2f}, na, {rental.timestamp.strftime('%d/%m/%Y %H:%M:%S')}\n")
+        with RecordWriter(rental_file) as writer:
+            writer.write_lines(self._format_rental(rental, writer) for rental in self.rentals)
+        self._saved_rental_count = len(self.rentals)
+        return [writer]
+
+    def append_new_rentals(self, rental_file):
+        """Append only rentals added since the last load or save"""
+        with RecordWriter(rental_file, append=True) as writer:
+            writer.write_lines(self._format_rental(rental, writer)
+                               for rental in self.rentals[self._saved_rental_count:])
+        self._saved_rental_count = len(self.rentals)
+        return [writer]
+
+    def save_rental_partitions(self, directory, full=False):
+        """Rewrite the monthly partition files that changed (all of them when full is True)
+
+        Rentals loaded from a single file are split into partitions on their first save.
+        """
+        os.makedirs(directory, exist_ok=True)
+        if self._partitions is None:
+            self._partitions = {}
+            full = True
+        if full:
+            self._dirty_partitions.update(self._partitions)
+            self._dirty_partitions.update(self.partition_key(rental.timestamp) for rental in self.rentals)
+        # A partition is rewritten whole, so rentals on disk must be in memory first
+        self._load_partitions(self._dirty_partitions, datetime.max, update_rollups=False)
+
+        by_month = defaultdict(list)
+        for rental in self.rentals:
+            month = self.partition_key(rental.timestamp)
+            if month in self._dirty_partitions:
+                by_month[month].append(rental)
+        writers = []
+        for month in sorted(self._dirty_partitions):
+            filename = self._partitions.setdefault(month, os.path.join(directory, f"{month}.txt"))
+            with RecordWriter(filename) as writer:
+                writer.write_lines(self._format_rental(rental, writer) for rental in by_month[month])
+            writers.append(writer)
+            self._loaded_partitions.add(month)
+        self._dirty_partitions.clear()
+        return writers
+
+    def save_loans(self, loan_file):
+        with RecordWriter(loan_file) as writer:
+            for loan in sorted(self.inventory.active_loans(), key=lambda loan: loan.loan_id):
+                due = datetime.fromtimestamp(loan.due)
+                writer.write_line(f"{loan.customer_id}, {loan.book_id}, {writer.format_timestamp(due)}")
+        return [writer]
+
+    def save_reservations(self, reservation_file):
+        with RecordWriter(reservation_file) as writer:
+            for book_id, customer_id in self.inventory.holds():
+                writer.write_line(f"H, {book_id}, {customer_id}")
+            for book_id, customer_id, sequence in self.reservations.entries():
+                writer.write_line(f"R, {book_id}, {customer_id}, {sequence}")
+        return [writer]
+
+    def save_rates(self, rate_file):
+        with RecordWriter(rate_file) as writer:
+            for customer_type, history in self.tier_discount_rates.items():
+                for start, rate in history.entries():
+                    start = writer.format_timestamp(start) if start else 'na'
+                    writer.write_line(f"T, {customer_type}, discount, {rate}, {start}")
+            for customer in self.customers:
+                histories = [('discount', getattr(customer, 'own_discount_rates', None)),
+                             ('reward', getattr(customer, 'reward_rates', None))]
+                for kind, history in histories:
+                    if history is None:
+                        continue
+                    for start, rate in history.entries():
+                        start = writer.format_timestamp(start) if start else 'na'
+                        writer.write_line(f"C, {customer.id}, {kind}, {rate}, {start}")
+        return [writer]
+
+    def save_books(self, book_file):
+        with RecordWriter(book_file) as writer:
+            writer.write_lines(self._format_book(book) for book in self.books)
+        return [writer]
+
+    def save_categories(self, category_file):
+        with RecordWriter(category_file) as writer:
+            writer.write_lines(self._format_category(category) for category in self.book_categories)
+        return [writer]
 
     def save_books_and_categories(self, book_file, category_file):
-        with open(book_file, 'w') as file:
-            for book in self.books:
-                if isinstance(book, BookSeries):
-                    book_names = [b.name for b in book.books]
-                    file.write(f"{book.id}, {', '.join(book_names)}\n")
-                else:
-                    file.write(f"{book.id}, {book.name}\n")
+        return self.save_books(book_file) + self.save_categories(category_file)
 
-        with open(category_file, 'w') as file:
-            for category in self.book_categories:
-                book_names = [book.name for book in category.books]
-                file.write(f"{category.id}, {category.name}, {category.type}, {category.price_1}, {category.price_2}, {', '.join(book_names)}\n")
+    @staticmethod
+    def sidecar_file(rental_file, name):
+        """Path of a file kept next to the rental file or partition directory, e.g. loans.txt"""
+        return os.path.join(os.path.dirname(os.path.normpath(rental_file)), name)
+
+    def save_import_progress(self, rental_file, hash_file=None):
+        """Commit an import in progress: its new rentals, their import hashes and the checkpoint
+
+        Rentals are appended (or only the months they touched rewritten) and the hashes
+        journaled, so a commit costs what was imported since the last one. Rollups, loans,
+        customers and the hash index itself are left for the next save_data().
+        """
+        if self.read_only:
+            return []
+        if hash_file is None:
+            hash_file = self.sidecar_file(rental_file, "imports.idx")
+        writers = []
+        if self._partitions is not None or os.path.isdir(rental_file):
+            writers += self.save_rental_partitions(rental_file)
+        elif not os.path.exists(rental_file):
+            writers += self.save_rentals(rental_file)
+        else:
+            writers += self.append_new_rentals(rental_file)
+        writers += self.import_hashes.append_journal(hash_file)
+        if self._import_checkpoint:
+            # After the rentals, so the checkpoint never points past what is on disk
+            writers += self.save_import_checkpoint()
+        return writers
+
+    def save_data(self, customer_file, book_file, category_file, rental_file, full=False, rollup_file=None,
+                  loan_file=None, reservation_file=None, rate_file=None, id_file=None, hash_file=None):
+        """Save changed collections only, or everything when full is True
+
+        Rollups, active loans, reservations, rate histories, the customer ID high-water
+        mark and the import hash index are saved next to the rental file unless their
+        file is given.
+        """
+        if self.read_only:
+            print("Records are read-only; nothing was saved.")
+            return []
+
+        writers = []
+        if full or 'customers' in self._dirty:
+            writers += self.save_customers(customer_file)
+        if full or 'books' in self._dirty:
+            writers += self.save_books(book_file)
+        if full or 'categories' in self._dirty:
+            writers += self.save_categories(category_file)
+        if rollup_file is None:
+            rollup_file = self.sidecar_file(rental_file, "rollups.txt")
+        if full or 'rentals' in self._dirty or not os.path.exists(rollup_file):
+            writers += self.rollups.save(rollup_file)
+        if loan_file is None:
+            loan_file = self.sidecar_file(rental_file, "loans.txt")
+        if full or 'loans' in self._dirty:
+            writers += self.save_loans(loan_file)
+        if reservation_file is None:
+            reservation_file = self.sidecar_file(rental_file, "reservations.txt")
+        if full or 'reservations' in self._dirty:
+            writers += self.save_reservations(reservation_file)
+        if rate_file is None:
+            rate_file = self.sidecar_file(rental_file, "rates.txt")
+        if full or 'rates' in self._dirty:
+            writers += self.save_rates(rate_file)
+        if id_file is None:
+            id_file = self.sidecar_file(rental_file, "ids.txt")
+        if full or 'ids' in self._dirty:
+            writers += self.customer_ids.save(id_file)
+        if hash_file is None:
+            hash_file = self.sidecar_file(rental_file, "imports.idx")
+        if full or 'imports' in self._dirty:
+            writers += self.import_hashes.save(hash_file)
+        if self._partitions is not None or os.path.isdir(rental_file):
+            if full or 'rentals' in self._dirty:
+                writers += self.save_rental_partitions(rental_file, full)
+        elif full or not os.path.exists(rental_file):
+            writers += self.save_rentals(rental_file)
+        elif 'rentals' in self._dirty:
+            writers += self.append_new_rentals(rental_file)
+        if self._import_checkpoint:
+            # After the rentals, so the checkpoint never points past what is on disk
+            writers += self.save_import_checkpoint()
+        self._dirty.clear()
+
+        if not writers:
+            print("No changes to save.")
+        for writer in writers:
+            print(f"Saved {writer.report()}")
+        return writers
+
+def load_records_directory(directory):
+    """Load one data directory into a Records (module level so worker processes can run it)"""
+    records = Records()
+    records.read_customers(os.path.join(directory, "customers.txt"))
+    records.read_customer_ids(os.path.join(directory, "ids.txt"))
+    records.read_rates(os.path.join(directory, "rates.txt"))
+    records.read_books_and_book_categories(os.path.join(directory, "books.txt"),
+                                           os.path.join(directory, "book_categories.txt"))
+    records.read_rentals(os.path.join(directory, "rentals.txt"))
+    return records
+
+class ShardedRecords:
+    """Facade over several data directories, one Records shard per directory"""
+    def __init__(self, directories, max_workers=None):
+        self.directories = list(directories)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            self.shards = list(executor.map(load_records_directory, self.directories))
+
+        # Global index: first shard to define an ID or name owns it
+        self._customer_ids = {}
+        self._customer_names = {}
+        self._book_keys = {}
+        for shard_no, shard in enumerate(self.shards):
+            for customer in shard.customers:
+                self._customer_ids.setdefault(customer.id, shard_no)
+                self._customer_names.setdefault(customer.name.lower(), shard_no)
+            for book in shard.books:
+                self._book_keys.setdefault(book.id.lower(), shard_no)
+                if isinstance(book, Book):
+                    self._book_keys.setdefault(book.name.lower(), shard_no)
+
+    def shard_of_customer(self, search_value):
+        shard_no = self._customer_ids.get(search_value)
+        if shard_no is None:
+            shard_no = self._customer_names.get(search_value.lower())
+        return shard_no
 
-    # Keep existing save_data as backup if full save is needed
-    def save_data(self, customer_file, book_file, category_file, rental_file):
-        self.save_customers(customer_file)
-        self.save_books_and_categories(book_file, category_file)
-        self.save_rentals(rental_file)
+    def find_customer(self, search_value):
+        shard_no = self.shard_of_customer(search_value)
+        if shard_no is None:
+            return None
+        return self.shards[shard_no].find_customer(search_value)
+
+    def find_book(self, search_value):
+        shard_no = self._book_keys.get(search_value.lower())
+        if shard_no is None:
+            return None
+        return self.shards[shard_no].find_book(search_value)
+
+    def get_customer_spending(self):
+        """Merge per-shard spending, summing customers that appear in several shards"""
+        customer_spending = defaultdict(int)
+        for shard in self.shards:
+            for customer_id, total in shard.get_customer_spending().items():
+                customer_spending[customer_id] += total
+        return customer_spending
+
+    def get_most_valuable_customer(self):
+        customer_spending = self.get_customer_spending()
+        if not customer_spending:
+            return None
+
+        max_id = max(customer_spending.items(), key=lambda x: x[1])[0]
+        return self.find_customer(max_id)
 
 class Operations:
     def __init__(self):
-        self.records = Records()
+        self.records = Records(read_only='--read-only' in sys.argv)
         self.load_data()
 
     def load_data(self):
@@ -617,20 +3246,44 @@ class Operations:
         category_file = "book_categories.txt"
         rental_file = "rentals.txt"
 
-        # Check command line arguments
-        if len(sys.argv) == 4:
-            customer_file = sys.argv[1]
-            book_file = sys.argv[2]
-            category_file = sys.argv[3]
-        elif len(sys.argv) > 1:
-            print("Usage: python program.py [customer_file book_file category_file]")
+        # Check command line arguments; any file may be gzip, bz2 or xz compressed
+        args = [arg for arg in sys.argv[1:] if arg not in ('--read-only', '--memory-report')]
+        if len(args) in (3, 4):
+            customer_file = args[0]
+            book_file = args[1]
+            category_file = args[2]
+            if len(args) == 4:
+                rental_file = args[3]
+        elif args:
+            print("Usage: python program.py [--read-only] [--memory-report] [customer_file book_file category_file [rental_file|rental_dir]]")
             sys.exit(1)
+        # Changes are saved back to the files they were loaded from
+        self.files = (customer_file, book_file, category_file, rental_file)
+
+        # Other data files are kept next to the rental file, where save_data writes them
+        def sidecar(name):
+            return self.records.sidecar_file(rental_file, name)
 
         try:
             self.records.read_customers(customer_file)
+            self.records.read_customer_ids(sidecar("ids.txt"))
+            self.records.read_rates(sidecar("rates.txt"))
             self.records.read_books_and_book_categories(book_file, category_file)
-            self.records.read_rentals(rental_file)
+            if self.records.read_only:
+                self.records.open_rental_index(rental_file)
+                self.records.read_rollups(sidecar("rollups.txt"))
+            else:
+                if os.path.isdir(rental_file):
+                    # Monthly partitions: recent months now, older ones when a query needs them
+                    self.records.read_rental_partitions(rental_file, rollup_file=sidecar("rollups.txt"))
+                else:
+                    self.records.read_rentals(rental_file)
+                self.records.read_loans(sidecar("loans.txt"))
+                self.records.read_reservations(sidecar("reservations.txt"))
+                self.records.read_import_hashes(sidecar("imports.idx"))
             print("Data loaded successfully!")
+            if '--memory-report' in sys.argv:
+                self.display_memory_report()
         except FileNotFoundError as e:
             print(f"Error: {e}")
             sys.exit(1)
@@ -723,12 +3376,20 @@ class Operations:
     #     rental.display_receipt()
     #     self.records.add_rental(rental)
 
+    def refuse_read_only(self):
+        #Nothing changed in read-only mode can be saved, so changing actions stop before touching any state
+        if self.records.read_only:
+            print("\nRecords were opened in read-only mode; this option is not available.")
+            return True
+        return False
+
     def rent_book(self):
         """Handle book rental process"""
+        if self.refuse_read_only():
+            return
         print("\nRent a Book")
 
         customer = None
-        is_new_customer = False
 
         while customer is None:
             customer_input = input("Enter customer ID or name: ").strip()
@@ -744,8 +3405,8 @@ class Operations:
                 name = customer_input
                 if name.replace(" ", "").isalpha():
                     customer = Customer("TEMP", name)  # temporary ID
+                    # New customers are registered straight away as Members
                     customer = self.register_customer(customer)
-                    is_new_customer = True
                 else:
                     print("Invalid name. Try again.")
                     customer = None
@@ -762,13 +3423,22 @@ class Operations:
                     break
 
                 found_book = self.records.find_book(book_input)
-                if found_book:
+                if found_book and not self.records.inventory.is_available(found_book, customer.id, books_and_days):
+                    print("No copies are available right now.")
+                    ans = input("Do you want to reserve it? (y/n)").strip()
+                    if ans.lower() == 'y':
+                        if self.records.reserve_book(found_book, customer):
+                            print(f"Reserved for {customer.name}. A copy will be held when one is returned.")
+                        else:
+                            print(f"{customer.name} has already reserved this book.")
+                elif found_book:
                     book = found_book
                     if isinstance(book, BookSeries):
                         book_titles = ', '.join(b.name for b in book.books)
                         print(f"Book Series selected: {book_titles}")
                     elif book.category and book.category.type == "Reference":
                         print("Note: This is a reference book with 14-day limit.")
+                    self.display_recommendations(book, books_and_days)
                 else:
                     print("Book not found. Please try again.")
 
@@ -801,27 +3471,59 @@ class Operations:
                 except (InvalidDaysError, ReferenceBookLimitError) as e:
                     print(e)
 
-        # Ask to register if this was a new customer
-        if is_new_customer:
-            ans = input('Do you want to register as a member and get discounts? (y/n)').strip()
-            if ans.lower() == 'y':
-                if customer in self.records.customers:
-                    self.records.customers.remove(customer)
-                member = Member(customer.id, customer.name)
-                self.records.customers.append(member)
-                customer = member
-                print(customer.discount_rate)
-                print(f"{customer.name} has been registered as a Member.")
+        # Copies may have gone since the books were chosen; check before any points are redeemed
+        if not self.records.inventory.can_checkout(books_and_days, customer.id):
+            print("Not enough copies are available for this rental. Operation cancelled.")
+            return
 
         # Create and process rental
         rental = Rental(customer, books_and_days)
         rental.display_receipt()
-        self.records.add_rental(rental)
+        self.records.add_rental(rental, strict=True)
+
+    def report_overdue_loans(self):
+        """Announce loans that became overdue since the last check"""
+        for loan in self.records.inventory.scheduler.advance():
+            due = datetime.fromtimestamp(loan.due).strftime('%d/%m/%Y %H:%M:%S')
+            print(f"Overdue: {loan.book_id} rented by customer {loan.customer_id} was due {due}")
+
+    def return_books(self):
+        """Handle returning books to the shelf"""
+        if self.refuse_read_only():
+            return
+        print("\nReturn a Book")
+        customer = None
+        while customer is None:
+            search = input("Enter customer ID or name: ").strip()
+            if not search:
+                return
+            customer = self.records.find_customer(search)
+            if not customer:
+                print("Customer not found. Try again or press Enter to cancel.")
+
+        while True:
+            book_input = input("Enter book ID or name to return (or 'done' to finish): ").strip()
+            if not book_input or book_input.lower() == 'done':
+                return
+            book = self.records.find_book(book_input)
+            if not book:
+                print("Book not found. Please try again.")
+                continue
+            returned = self.records.return_book(customer.id, book)
+            if not returned:
+                print(f"{customer.name} has no copy of that book on loan.")
+                continue
+            now = datetime.now().timestamp()
+            for loan, held_for in returned:
+                late = " (overdue)" if loan.due < now else ""
+                print(f"Returned {loan.book_id}{late}")
+                if held_for:
+                    print(f"{loan.book_id} is now held for customer {held_for}")
 
     def register_customer(self, customer):
-        customer_id = f"M{len(self.records.customers) + 1:03d}"
+        customer_id = self.records.allocate_customer_ids()
         new_customer = Member(customer_id, customer.name)
-        self.records.customers.append(new_customer)
+        self.records.add_customer(new_customer)
         print(f"{customer.name} has been registered as a Member with ID {customer_id}.")
         return new_customer
 
@@ -830,6 +3532,8 @@ class Operations:
 
     def update_book_category(self):
         """Update book category information (DI level)"""
+        if self.refuse_read_only():
+            return
         print("\nUpdate Book Category")
 
         # Find category
@@ -856,6 +3560,7 @@ class Operations:
                 break
             if new_type in ['Rental', 'Reference']:
                 category.type = new_type
+                self.records.mark_dirty('categories')
                 break
             print("Invalid type. Must be 'Rental' or 'Reference'")
 
@@ -865,10 +3570,12 @@ class Operations:
                 price_1 = input(f"Price 1 (current: {category.price_1}): ").strip()
                 if price_1:
                     category.price_1 = float(price_1)
+                    self.records.mark_dirty('categories')
 
                 price_2 = input(f"Price 2 (current: {category.price_2}): ").strip()
                 if price_2:
                     category.price_2 = float(price_2)
+                    self.records.mark_dirty('categories')
 
                 break
             except ValueError:
@@ -878,6 +3585,8 @@ class Operations:
 
     def update_books_in_category(self):
         """Update books in a category (DI level)"""
+        if self.refuse_read_only():
+            return
         print("\nUpdate Books in Category")
 
         # Find category
@@ -930,6 +3639,7 @@ class Operations:
                     book.category.remove_book(book)
 
                 category.add_book(book)
+                self.records.mark_dirty('categories')
                 added += 1
                 print(f"Added '{book.name}' to category '{category.name}'.")
 
@@ -947,6 +3657,7 @@ class Operations:
             book = self.records.find_book(book_id)
             if book and book in category.books:
                 category.remove_book(book)
+                self.records.mark_dirty('categories')
                 removed += 1
             else:
                 print(f"Book {book_id} not found in category")
@@ -955,6 +3666,8 @@ class Operations:
 
     def adjust_member_discount(self):
         """Adjust discount rate for all members (DI level)"""
+        if self.refuse_read_only():
+            return
         print("\nAdjust Discount Rate for All Members")
 
         while True:
@@ -968,8 +3681,9 @@ class Operations:
                     print("Rate must be between 0 and 1 (exclusive)")
                     continue
 
-                Member.set_discount_rate(rate)
-                GoldMember.set_discount_rate(rate)
+                self.records.set_tier_discount_rate('M', rate)
+                self.records.set_tier_discount_rate('G', rate)
+                self.records.mark_dirty('customers')
                 print(f"Discount rate updated to {rate*100:.0f}% for all members")
                 break
             except ValueError:
@@ -979,6 +3693,8 @@ class Operations:
 
     def adjust_gold_reward_rate(self):
         """Adjust reward rate for a Gold member (DI level)"""
+        if self.refuse_read_only():
+            return
         print("\nAdjust Reward Rate for Gold Member")
 
         # Find Gold member
@@ -1012,53 +3728,150 @@ class Operations:
                     continue
 
                 member.set_reward_rate(rate)
+                self.records.mark_dirty('customers', 'rates')
                 print(f"Reward rate updated to {rate*100:.0f}% for {member.name}")
                 break
             except ValueError:
                 print("Invalid rate. Must be a number (e.g., 1 for 100%)")
 
+    def display_recommendations(self, book, books_and_days):
+        #Suggest titles other customers rented alongside book, skipping those already chosen
+        chosen = [component.id for item, days in books_and_days
+                  for component in (item.books if isinstance(item, BookSeries) else [item]) if component]
+        suggestions = self.records.similar_books(book, n=3, exclude=chosen)
+        if suggestions:
+            titles = ', '.join(f"{other.name} ({other.id})" for other, count in suggestions)
+            print(f"Customers who rented this also rented: {titles}")
+
     def rent_books_via_file(self):
         """Process rentals from a file (HD level)"""
+        if self.refuse_read_only():
+            return
         filename = input("\nEnter rental file name: ").strip()
         if not filename:
             return
 
-        self.records.process_rental_file(filename)
+        resume = False
+        checkpoint = self.records.read_import_checkpoint(filename)
+        if checkpoint:
+            answer = input(f"An earlier import of {filename} stopped after line {checkpoint.line_no}. "
+                           f"Resume from there? (y/n): ").strip().lower()
+            resume = answer == 'y'
+        self.records.process_rental_file(filename, resume=resume, commit=self.commit_import)
 
-    def display_all_rentals(self):
-        """Display all rental history (HD level)"""
-        if not self.records.rentals:
-            print("\nNo rentals found")
+        if input(f"Keep following {filename} for new rentals? (y/n): ").strip().lower() != 'y':
             return
+        print("Following... press Ctrl-C to stop.")
 
-        print("\nAll Rentals:")
-        print("-" * 80)
-        for rental in self.records.rentals:
-            print(f"Date: {rental.timestamp.strftime('%d/%m/%Y %H:%M:%S')}")
-            print(f"Customer: {rental.customer.name} ({rental.customer.id})")
-            print("Books:")
-            for book, days in rental.books_and_days:
-                print(f"- {book.name} for {days} days")
-            print(f"Original Cost: {rental.original_cost:.2f} AUD")
-            print(f"Discount: {rental.discount:.2f} AUD")
-            print(f"Total Cost: {rental.total_cost:.2f} AUD")
-            if isinstance(rental.customer, GoldMember):
-                print(f"Reward Earned: {rental.reward}")
-            print("-" * 80)
+        def report_batch(imported, skipped):
+            if imported:
+                print(f"Imported {imported} new rentals from {filename}")
+
+        try:
+            self.records.follow_rental_file(filename, commit=self.commit_import, on_batch=report_batch)
+        except KeyboardInterrupt:
+            print(f"\nStopped following {filename}.")
+        self.save_data()
+
+    def save_data(self):
+        self.records.save_data(*self.files)
+
+    def commit_import(self):
+        #Checkpoints of a long import only write what it added; the rest is saved at the end
+        self.records.save_import_progress(self.files[3])
+
+    def ask_listing_options(self):
+        """Ask for optional paging options; Enter lists everything"""
+        while True:
+            text = input("Listing options [--limit N] [--offset N] [--match TEXT] [--out FILE] (Enter for all): ").strip()
+            if not text:
+                return None
+            options = parse_listing_options(text)
+            if options:
+                return options
+
+    def format_rental_entry(self, rental):
+        lines = [f"Date: {rental.timestamp.strftime('%d/%m/%Y %H:%M:%S')}",
+                 f"Customer: {rental.customer.name} ({rental.customer.id})",
+                 "Books:"]
+        for book, days in rental.books_and_days:
+            if isinstance(book, BookSeries):
+                lines.append(f"- Book Series [{book.id}] for {days} days")
+            else:
+                lines.append(f"- {book.name} for {days} days")
+        lines.append(f"Original Cost: {format_cents(rental.original_cost)} AUD")
+        lines.append(f"Discount: {format_cents(rental.discount)} AUD")
+        lines.append(f"Total Cost: {format_cents(rental.total_cost)} AUD")
+        if TierPolicy.for_customer(rental.customer).rewards:
+            lines.append(f"Reward Earned: {rental.reward}")
+        lines.append("-" * 80)
+        return "\n".join(lines) + "\n"
+
+    def format_indexed_rental_entry(self, row):
+        timestamp = row['timestamp'].strftime('%d/%m/%Y %H:%M:%S') if row['timestamp'] else 'unknown'
+        lines = [f"Date: {timestamp}",
+                 f"Customer: {row['customer_id']}",
+                 f"Books: {row['books_info']}",
+                 f"Original Cost: {format_cents(row['original_cost'])} AUD",
+                 f"Discount: {format_cents(row['discount'])} AUD",
+                 f"Total Cost: {format_cents(row['total_cost'])} AUD"]
+        if row['reward'] != 'na':
+            lines.append(f"Reward Earned: {row['reward']}")
+        lines.append("-" * 80)
+        return "\n".join(lines) + "\n"
+
+    def display_all_rentals(self, output=None):
+        """Display all rental history (HD level)"""
+        output = output or PagedOutput()
+        header = "\nAll Rentals:\n" + "-" * 80 + "\n"
+        if self.records.read_only:
+            entries = (self.format_indexed_rental_entry(row) for row in self.records.iter_rental_rows())
+        else:
+            # Older monthly partitions are read first, so the listing covers all history
+            self.records.load_partitions()
+            if not self.records.rentals:
+                print("\nNo rentals found")
+                return
+            entries = (self.format_rental_entry(rental) for rental in self.records.rentals)
+
+        if not output.render(header, entries, footer=""):
+            print("No rentals found")
+
+    def display_memory_report(self):
+        print("\nMemory use of shared storage:")
+        print(f"{'Structure':<28} | {'Now (KB)':>10} | {'Unshared (KB)':>13}")
+        print("-" * 57)
+        for name, now, unshared in self.records.memory_report():
+            print(f"{name:<28} | {now / 1024:>10.1f} | {unshared / 1024:>13.1f}")
+
+    def ask_date_range(self):
+        """Ask for an optional 'DD/MM/YYYY-DD/MM/YYYY' range; (None, None) means all time"""
+        while True:
+            text = input("Date range (DD/MM/YYYY-DD/MM/YYYY, Enter for all time): ").strip()
+            if not text:
+                return None, None
+            try:
+                first, last = (part.strip() for part in text.split('-'))
+                start = datetime.strptime(first, '%d/%m/%Y')
+                end = datetime.strptime(last, '%d/%m/%Y') + timedelta(days=1) - timedelta(microseconds=1)
+                return start, end
+            except ValueError:
+                print("Invalid range. Example: 01/04/2025-30/06/2025")
 
     def display_most_valuable_customer(self):
-        customer = self.records.get_most_valuable_customer()
+        start, end = self.ask_date_range()
+        customer = self.records.get_most_valuable_customer(start, end)
         if not customer:
             print("\nNo rentals found to determine valuable customer")
             return
 
         # Calculate total spending
-        total = sum(r.total_cost for r in self.records._customer_rentals.get(customer.id, []))
+        total = self.records.get_customer_spending(start, end)[customer.id]
 
         print("\nMost Valuable Customer:")
         print("-" * 40)
         customer.display_info()
-        print(f"Total Spending: {total:.2f} AUD")
+        print(f"Total Spending: {format_cents(total)} AUD")
         print("-" * 40)
 
     def display_customer_rental_history(self):
@@ -1075,7 +3888,8 @@ class Operations:
                 print("Customer not found. Try again or press Enter to cancel.")
                 return
 
-        history = self.records.get_customer_rental_history(customer.id)
+        start, end = self.ask_date_range()
+        history = self.records.get_customer_rental_history(customer.id, start, end)
         if not history:
             print(f"\nNo rental history found for {customer.name}")
             return
@@ -1088,8 +3902,8 @@ class Operations:
 
         for rental in history:
             print(f"{rental['rental_num']:<10} | {rental['books_info'][:40]:<40} | "
-                  f"{rental['original_cost']:<12.2f} | {rental['discount']:<10.2f} | "
-                  f"{rental['total_cost']:<10.2f} | {rental['reward']:<8}")
+                  f"{format_cents(rental['original_cost']):<12} | {format_cents(rental['discount']):<10} | "
+                  f"{format_cents(rental['total_cost']):<10} | {rental['reward']:<8}")
         print("-" * 100)
 
     def display_menu(self):
@@ -1107,23 +3921,25 @@ class Operations:
         print("10. Display all rentals")
         print("11. Display the most valuable customer")
         print("12. Display a customer rental history")
-        print("13. Exit")
+        print("13. Return a book")
+        print("14. Exit")
 
 
     def run(self):
         while True:
+            self.report_overdue_loans()
             self.display_menu()
-            choice = input("Enter your choice (1-13): ")
+            choice = input("Enter your choice (1-14): ")
 
             try:
                 if choice == '1':
                     self.rent_book()
                 elif choice == '2':
-                    self.records.list_customers()
+                    self.records.list_customers(PagedOutput.from_options(self.ask_listing_options()))
                 elif choice == '3':
-                    self.records.list_book_categories()
+                    self.records.list_book_categories(PagedOutput.from_options(self.ask_listing_options()))
                 elif choice == '4':
-                    self.records.list_books()
+                    self.records.list_books(PagedOutput.from_options(self.ask_listing_options()))
                 elif choice == '5':
                     self.update_book_category()
                 elif choice == '6':
@@ -1135,18 +3951,20 @@ class Operations:
                 elif choice == '9':
                     self.rent_books_via_file()
                 elif choice == '10':
-                    self.display_all_rentals()
+                    self.display_all_rentals(PagedOutput.from_options(self.ask_listing_options()))
                 elif choice == '11':
                     self.display_most_valuable_customer()
                 elif choice == '12':
                     self.display_customer_rental_history()
                 elif choice == '13':
+                    self.return_books()
+                elif choice == '14':
                     # Save data before exiting
-                    self.records.save_data("customers.txt", "books.txt", "book_categories.txt", "rentals.txt")
+                    self.save_data()
                     print("Thank you for using the Book Rental System. Goodbye!")
                     break
                 else:
-                    print("Invalid choice. Please enter a number between 1 and 13.")
+                    print("Invalid choice. Please enter a number between 1 and 14.")
             except Exception as e:
                 print(f"An error occurred: {e}")
 
@@ -1158,7 +3976,7 @@ if __name__ == "__main__":
         system.run()
     except KeyboardInterrupt:
         print("\nProgram interrupted. Saving data...")
-        system.records.save_data("customers.txt", "books.txt", "book_categories.txt", "rentals.txt")
+        system.save_data()
         print("Goodbye!")
     except Exception as e:
         print("Fatal error:")